@@ -4,19 +4,17 @@ Add test leads to Airtable for Niya agent testing
 """
 
 import os
-import requests
 from dotenv import load_dotenv
 
+import airtable_client
+
 load_dotenv()
 
 # Configuration
 AIRTABLE_TOKEN = os.getenv("AIRTABLE_TOKEN")
 LEADS_BASE_ID = os.getenv("LEADS_BASE_ID")
 
-headers = {
-    "Authorization": f"Bearer {AIRTABLE_TOKEN}",
-    "Content-Type": "application/json"
-}
+headers = airtable_client.auth_headers(AIRTABLE_TOKEN)
 
 def add_test_leads():
     """Add sample test leads to Airtable"""
@@ -57,30 +55,27 @@ def add_test_leads():
         }
     ]
     
-    url = f"https://api.airtable.com/v0/{LEADS_BASE_ID}/Imported table"
+    url = airtable_client.table_url(LEADS_BASE_ID, "Imported table")
     
     print("🚀 Adding test leads to Airtable...")
     
-    for i, lead in enumerate(test_leads):
-        payload = {
-            "records": [{
-                "fields": lead
-            }]
-        }
-        
-        response = requests.post(url, headers=headers, json=payload)
-        
-        if response.status_code == 200:
-            print(f"✅ Added lead {i+1}: {lead['Lead Name']} at {lead['Company Name']}")
-        else:
-            print(f"❌ Failed to add lead {i+1}: {response.status_code} - {response.text}")
+    # All test leads fit in a single request (Airtable allows up to 10)
+    try:
+        created = airtable_client.batch_write("POST", url, headers, [{"fields": lead} for lead in test_leads])
+    except Exception as e:
+        print(f"❌ Failed to add test leads: {e}")
+        return
+    
+    for i, record in enumerate(created):
+        fields = record['fields']
+        print(f"✅ Added lead {i+1}: {fields.get('Lead Name')} at {fields.get('Company Name')}")
     
-    print(f"\n🎯 Added {len(test_leads)} test leads successfully!")
+    print(f"\n🎯 Added {len(created)} test leads successfully!")
 
 def check_existing_leads():
     """Check existing leads in the table"""
-    url = f"https://api.airtable.com/v0/{LEADS_BASE_ID}/Imported table"
-    response = requests.get(url, headers=headers, params={"maxRecords": 10})
+    url = airtable_client.table_url(LEADS_BASE_ID, "Imported table")
+    response = airtable_client.request("GET", url, headers=headers, params={"maxRecords": 10})
     
     if response.status_code == 200:
         data = response.json()
@@ -0,0 +1,139 @@
+"""
+Read-through cache for Airtable list queries
+Entries are keyed by base/table/formula/fields, expire after a TTL, and are kept in step with our
+own writes. Least recently used entries spill to an optional SQLite file instead of being dropped.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds; off by default: one agent run reads each query once and writes in between, so nothing is reused
+AIRTABLE_CACHE_TTL = float(os.getenv("AIRTABLE_CACHE_TTL", "0"))
+AIRTABLE_CACHE_MAX_RECORDS = int(os.getenv("AIRTABLE_CACHE_MAX_RECORDS", "20000"))  # Held in memory
+AIRTABLE_CACHE_DB = os.getenv("AIRTABLE_CACHE_DB")  # Optional SQLite spill file
+
+CacheKey = Tuple[str, str, str, Tuple[str, ...]]
+
+
+def cache_key(base_id: str, table_name: str, formula: Optional[str], fields: Optional[List[str]]) -> CacheKey:
+    return (base_id, table_name, formula or "", tuple(fields or ()))
+
+
+class RecordCache:
+    """In-memory LRU of query results with TTL expiry and an optional SQLite spill"""
+
+    def __init__(self, ttl: float = AIRTABLE_CACHE_TTL, max_records: int = AIRTABLE_CACHE_MAX_RECORDS,
+                 db_path: Optional[str] = AIRTABLE_CACHE_DB):
+        self.ttl = ttl
+        self.max_records = max_records
+        self._entries: "OrderedDict[CacheKey, Tuple[float, List[Dict]]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_cache ("
+                " base_id TEXT, table_name TEXT, formula TEXT, fields TEXT,"
+                " stored_at REAL, records TEXT,"
+                " PRIMARY KEY (base_id, table_name, formula, fields))"
+            )
+            self._db.commit()
+
+    def get(self, key: CacheKey) -> Optional[List[Dict]]:
+        """Return cached records for a query, or None on a miss or expired entry"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, records = entry
+                if now - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    return records
+                self._drop(key)
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT stored_at, records FROM query_cache"
+                    " WHERE base_id=? AND table_name=? AND formula=? AND fields=?",
+                    self._db_key(key)
+                ).fetchone()
+                if row and now - row[0] < self.ttl:
+                    return json.loads(row[1])
+        return None
+
+    def put(self, key: CacheKey, records: List[Dict]):
+        """Store the full result of a query"""
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.time(), records)
+            self._size += len(records)
+            # Evict least recently used entries, spilling them to SQLite when configured
+            while self._size > self.max_records and len(self._entries) > 1:
+                old_key, (stored_at, old_records) = self._entries.popitem(last=False)
+                self._size -= len(old_records)
+                if self._db is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?, ?, ?)",
+                        self._db_key(old_key) + (stored_at, json.dumps(old_records))
+                    )
+                    self._db.commit()
+
+    def record_written(self, base_id: str, table_name: str, records: List[Dict], created: bool = False):
+        """Write-through after a successful create/update
+
+        Unfiltered queries are patched in place because a write cannot change which records they
+        contain. Filtered queries are dropped: the write may move a record in or out of the result
+        and Airtable formulas cannot be evaluated locally.
+        """
+        written = {record["id"]: record for record in records}
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == base_id and k[1] == table_name]:
+                formula, fields = key[2], key[3]
+                if formula:
+                    self._drop(key)
+                    continue
+                stored_at, cached = self._entries[key]
+                patched = [self._project(written[r["id"]], fields) if r["id"] in written else r
+                           for r in cached]
+                if created:
+                    patched.extend(self._project(r, fields) for r in records)
+                self._entries[key] = (stored_at, patched)
+                self._size += len(patched) - len(cached)
+            if self._db is not None:
+                self._db.execute("DELETE FROM query_cache WHERE base_id=? AND table_name=?",
+                                 (base_id, table_name))
+                self._db.commit()
+
+    def invalidate(self, base_id: str, table_name: str):
+        """Forget every cached query for a table"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == base_id and k[1] == table_name]:
+                self._drop(key)
+            if self._db is not None:
+                self._db.execute("DELETE FROM query_cache WHERE base_id=? AND table_name=?",
+                                 (base_id, table_name))
+                self._db.commit()
+
+    def _drop(self, key: CacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    @staticmethod
+    def _project(record: Dict, fields: Tuple[str, ...]) -> Dict:
+        if not fields:
+            return record
+        return {**record, "fields": {k: v for k, v in record.get("fields", {}).items() if k in fields}}
+
+    @staticmethod
+    def _db_key(key: CacheKey) -> Tuple[str, str, str, str]:
+        return (key[0], key[1], key[2], json.dumps(list(key[3])))
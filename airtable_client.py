@@ -0,0 +1,189 @@
+"""
+Shared Airtable HTTP client
+One pooled, keep-alive requests.Session reused by every AirtableAPI in the project
+"""
+
+import asyncio
+import os
+import threading
+import urllib.parse
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import rate_limiter
+
+load_dotenv()
+
+# Configuration
+AIRTABLE_API_URL = os.getenv("AIRTABLE_API_URL", "https://api.airtable.com/v0")
+AIRTABLE_POOL_SIZE = int(os.getenv("AIRTABLE_POOL_SIZE", "10"))
+AIRTABLE_MAX_RETRIES = int(os.getenv("AIRTABLE_MAX_RETRIES", "5"))
+AIRTABLE_BACKOFF_FACTOR = float(os.getenv("AIRTABLE_BACKOFF_FACTOR", "0.5"))
+AIRTABLE_TIMEOUT = float(os.getenv("AIRTABLE_TIMEOUT", "30"))
+BATCH_SIZE = 10  # Airtable accepts at most 10 records per create/update request
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class AirtableRetry(Retry):
+    """Retry policy that never replays a POST unless Airtable rejected it with 429
+
+    POST is left out of allowed_methods, so urllib3 does not resend it after a read timeout or a
+    dropped connection either; the records may already have been created by then.
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        # A 429 is refused before anything is written; a 5xx on POST may already have created the records
+        if method == "POST":
+            return status_code == 429
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def build_session(pool_size: int = AIRTABLE_POOL_SIZE, max_retries: int = AIRTABLE_MAX_RETRIES,
+                  backoff_factor: float = AIRTABLE_BACKOFF_FACTOR) -> requests.Session:
+    """Create a keep-alive session with a connection pool and retry/backoff on 429/5xx"""
+    retry = AirtableRetry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "PATCH", "PUT", "DELETE"]),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def table_url(base_id: str, table_name: str) -> str:
+    """Build the REST URL for a table, URL encoding the table name to handle spaces"""
+    return f"{AIRTABLE_API_URL}/{base_id}/{urllib.parse.quote(table_name)}"
+
+
+def auth_headers(token: str) -> Dict:
+    """Standard JSON headers for a Personal Access Token"""
+    return {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+
+
+def _base_id(url: str) -> str:
+    """Extract the base ID from a table or record URL"""
+    return url[len(AIRTABLE_API_URL):].lstrip("/").split("/", 1)[0]
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """Send a request through the shared session; callers decide how to handle the status"""
+    kwargs.setdefault("timeout", AIRTABLE_TIMEOUT)
+    # Airtable's 5 requests/second limit applies per base
+    rate_limiter.acquire(f"airtable:{_base_id(url)}")
+    return get_session().request(method, url, **kwargs)
+
+
+def iter_records(url: str, headers: Dict, formula: str = None, fields: Optional[List[str]] = None,
+                 page_size: int = 100, max_records: Optional[int] = None) -> Iterator[Dict]:
+    """Yield records page by page, following Airtable's offset cursor, stopping after max_records"""
+    params = {"pageSize": min(page_size, 100)}
+    if formula:
+        params["filterByFormula"] = formula
+    if max_records:
+        params["maxRecords"] = max_records
+    if fields:
+        params["fields[]"] = fields
+
+    while True:
+        response = request("GET", url, headers=headers, params=params)
+        response.raise_for_status()
+
+        data = response.json()
+        yield from data.get("records", [])
+
+        # Airtable returns an offset until the last page has been served
+        offset = data.get("offset")
+        if not offset:
+            break
+        params["offset"] = offset
+
+
+def batch_write(method: str, url: str, headers: Dict, records: List[Dict],
+                extra: Optional[Dict] = None) -> List[Dict]:
+    """Send records in chunks of BATCH_SIZE, one request per chunk"""
+    results = []
+    for start in range(0, len(records), BATCH_SIZE):
+        payload = {"records": records[start:start + BATCH_SIZE]}
+        if extra:
+            payload.update(extra)
+
+        response = request(method, url, headers=headers, json=payload)
+        response.raise_for_status()
+
+        results.extend(response.json().get("records", []))
+    return results
+
+
+def build_async_client(pool_size: int = AIRTABLE_POOL_SIZE) -> httpx.AsyncClient:
+    """Create a keep-alive async client; it is bound to the running event loop, so build one per run"""
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    return httpx.AsyncClient(limits=limits, timeout=AIRTABLE_TIMEOUT)
+
+
+async def arequest(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+    """Async counterpart of request(), with the same rate limit and 429/5xx retry policy"""
+    for attempt in range(AIRTABLE_MAX_RETRIES + 1):
+        await rate_limiter.acquire_async(f"airtable:{_base_id(url)}")
+        response = await client.request(method, url, **kwargs)
+
+        retryable = response.status_code == 429 or (
+            response.status_code in RETRY_STATUSES and method != "POST"
+        )
+        if not retryable or attempt == AIRTABLE_MAX_RETRIES:
+            return response
+
+        retry_after = response.headers.get("Retry-After")
+        await asyncio.sleep(float(retry_after) if retry_after else AIRTABLE_BACKOFF_FACTOR * (2 ** attempt))
+    return response
+
+
+async def aiter_records(client: httpx.AsyncClient, url: str, headers: Dict, formula: str = None,
+                        fields: Optional[List[str]] = None, page_size: int = 100) -> AsyncIterator[Dict]:
+    """Async counterpart of iter_records()"""
+    params = {"pageSize": min(page_size, 100)}
+    if formula:
+        params["filterByFormula"] = formula
+    if fields:
+        params["fields[]"] = fields
+
+    while True:
+        response = await arequest(client, "GET", url, headers=headers, params=params)
+        response.raise_for_status()
+
+        data = response.json()
+        for record in data.get("records", []):
+            yield record
+
+        offset = data.get("offset")
+        if not offset:
+            break
+        params["offset"] = offset
@@ -6,12 +6,13 @@ Automatically generates leads from startup websites and uploads to Airtable
 
 import os
 import csv
-import time
 import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
 from dotenv import load_dotenv
 
+import airtable_client
+
 load_dotenv()
 
 # Configuration
@@ -144,48 +145,36 @@ class AutoLeadGenerator:
             print("❌ Airtable credentials not configured")
             return 0
         
-        headers = {
-            "Authorization": f"Bearer {AIRTABLE_TOKEN}",
-            "Content-Type": "application/json"
-        }
+        headers = airtable_client.auth_headers(AIRTABLE_TOKEN)
         
-        url = f"https://api.airtable.com/v0/{LEADS_BASE_ID}/Imported table"
+        url = airtable_client.table_url(LEADS_BASE_ID, "Imported table")
+        
+        # Prepare lead data
+        records = [{
+            "fields": {
+                "Company Name": company.get("Company Name", ""),
+                "Website/LinkedIn": company.get("Source URL", ""),
+                "Industry": company.get("Industry", "Technology"),
+                "Company Size": company.get("Company Size", "11-50 employees"),
+                "Role": company.get("Target Role", "CEO"),
+                "Email": "",  # Will be filled later
+                "Email Sent?": "FALSE",
+                "Status": "New Lead",
+                "Notes/Objections": f"Auto-generated from {company.get('Source', 'Unknown')} on {datetime.now().strftime('%Y-%m-%d')}"
+            }
+        } for company in companies]
         
-        uploaded_count = 0
+        # batch_write sends 10 records per request (Airtable's maximum) and stops at the first failed request
+        try:
+            created = airtable_client.batch_write("POST", url, headers, records)
+        except Exception as e:
+            print(f"❌ Error uploading leads: {e}")
+            print("⚠️ Leads in the requests before the failed one were uploaded; check Airtable before re-running")
+            return 0
         
-        for company in companies:
-            try:
-                # Prepare lead data
-                lead_data = {
-                    "records": [{
-                        "fields": {
-                            "Company Name": company.get("Company Name", ""),
-                            "Website/LinkedIn": company.get("Source URL", ""),
-                            "Industry": company.get("Industry", "Technology"),
-                            "Company Size": company.get("Company Size", "11-50 employees"),
-                            "Role": company.get("Target Role", "CEO"),
-                            "Email": "",  # Will be filled later
-                            "Email Sent?": "FALSE",
-                            "Status": "New Lead",
-                            "Notes/Objections": f"Auto-generated from {company.get('Source', 'Unknown')} on {datetime.now().strftime('%Y-%m-%d')}"
-                        }
-                    }]
-                }
-                
-                response = requests.post(url, headers=headers, json=lead_data)
-                
-                if response.status_code == 200:
-                    uploaded_count += 1
-                    print(f"✅ Uploaded: {company['Company Name']}")
-                else:
-                    print(f"❌ Failed to upload {company['Company Name']}: {response.status_code}")
-                
-                # Rate limiting
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"❌ Error uploading {company['Company Name']}: {e}")
-                continue
+        uploaded_count = len(created)
+        for record in created:
+            print(f"✅ Uploaded: {record['fields'].get('Company Name', '')}")
         
         return uploaded_count
     
@@ -0,0 +1,160 @@
+"""
+Bulk chat completions through the OpenAI Batch API
+Requests are written to a JSONL file, submitted as one job and read back by custom_id.
+LocalBatchRunner honours the same file contract for development and for providers without a batch endpoint.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+import llm_client
+import rate_limiter
+
+load_dotenv()
+
+BATCH_DIR = os.getenv("BATCH_DIR", "batches")
+BATCH_BACKEND = os.getenv("BATCH_BACKEND", "openai").lower()  # "openai" or "local"
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "30"))
+BATCH_COMPLETION_WINDOW = "24h"  # The only window the Batch API accepts
+LOCAL_BATCH_WORKERS = int(os.getenv("LOCAL_BATCH_WORKERS", "4"))
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+
+
+def write_batch_file(path: str, prompts: Dict[str, str], model: str, max_tokens: Optional[int] = None,
+                     temperature: Optional[float] = None) -> str:
+    """Write one chat completion request per line, keyed by custom_id"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, prompt in prompts.items():
+            body = {"model": model, "messages": [{"role": "user", "content": prompt}]}
+            if max_tokens is not None:
+                body["max_tokens"] = max_tokens
+            if temperature is not None:
+                body["temperature"] = temperature
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": CHAT_COMPLETIONS_ENDPOINT,
+                "body": body
+            }) + "\n")
+    return path
+
+
+def read_batch_results(path: str, site: Optional[str] = None, seconds: float = 0.0,
+                       discounted: bool = True) -> Dict[str, str]:
+    """Map custom_id to completion text for every request that succeeded
+
+    With site, each response's token usage is recorded with the job's wall time as its latency, at
+    Batch API prices when discounted (pass the runner's discounted attribute).
+    """
+    results = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            if entry.get("error") or response.get("status_code") != 200:
+                print(f"⚠️ Batch request {entry.get('custom_id')} failed: {entry.get('error') or response}")
+                continue
+            body = response["body"]
+            content = body["choices"][0]["message"]["content"]
+            results[entry["custom_id"]] = content.strip()
+            usage = body.get("usage")
+            if site and usage:
+                llm_client.get_usage().record(site, body.get("model", ""), usage["prompt_tokens"],
+                                              usage["completion_tokens"], seconds, batch=discounted)
+    return results
+
+
+def is_pending(input_path: str) -> bool:
+    """True when a job for this request file was submitted and has not been collected yet"""
+    return os.path.exists(f"{input_path}.batch_id")
+
+
+class OpenAIBatchRunner:
+    """Submit a request file to the OpenAI Batch API and download the output file when done
+
+    The batch ID is saved next to the input file so a restarted run resumes polling the same job
+    instead of submitting (and paying for) a second one.
+    """
+
+    discounted = True  # Billed at Batch API prices
+
+    def __init__(self, client, poll_interval: float = BATCH_POLL_INTERVAL):
+        self.client = client
+        self.poll_interval = poll_interval
+
+    def run(self, input_path: str, output_path: str) -> str:
+        id_path = f"{input_path}.batch_id"
+        if is_pending(input_path):
+            with open(id_path, "r", encoding="utf-8") as f:
+                batch_id = f.read().strip()
+            print(f"🔁 Resuming batch {batch_id}")
+        else:
+            with open(input_path, "rb") as f:
+                uploaded = self.client.files.create(file=f, purpose="batch")
+            batch_id = self.client.batches.create(
+                input_file_id=uploaded.id,
+                endpoint=CHAT_COMPLETIONS_ENDPOINT,
+                completion_window=BATCH_COMPLETION_WINDOW
+            ).id
+            with open(id_path, "w", encoding="utf-8") as f:
+                f.write(batch_id)
+            print(f"📦 Submitted batch {batch_id}")
+
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status == "completed":
+                break
+            if batch.status in ("failed", "expired", "cancelled"):
+                os.remove(id_path)
+                raise RuntimeError(f"Batch {batch_id} ended with status {batch.status}")
+            counts = batch.request_counts
+            if counts is not None:
+                print(f"⏳ Batch {batch_id} {batch.status}: {counts.completed}/{counts.total} done")
+            time.sleep(self.poll_interval)
+
+        with open(output_path, "wb") as f:
+            if batch.output_file_id:
+                f.write(self.client.files.content(batch.output_file_id).read())
+        os.remove(id_path)
+        return output_path
+
+
+class LocalBatchRunner:
+    """Stand-in with the Batch API file contract that runs each request as a normal chat completion"""
+
+    discounted = False  # Normal chat completions, billed at full price
+
+    def __init__(self, create: Callable, workers: int = LOCAL_BATCH_WORKERS):
+        self.create = create
+        self.workers = workers
+
+    def _run_one(self, line: str) -> str:
+        request = json.loads(line)
+        body = request["body"]
+        entry = {"id": f"local_{request['custom_id']}", "custom_id": request["custom_id"],
+                 "response": None, "error": None}
+        try:
+            prompt = body["messages"][-1]["content"]
+            rate_limiter.acquire_openai(prompt, max_tokens=body.get("max_tokens") or 0)
+            response = self.create(**body)
+            entry["response"] = {"status_code": 200, "body": response.model_dump()}
+        except Exception as e:
+            entry["error"] = {"message": str(e)}
+        return json.dumps(entry)
+
+    def run(self, input_path: str, output_path: str) -> str:
+        with open(input_path, "r", encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            output = list(pool.map(self._run_one, lines))
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(output) + "\n")
+        return output_path
@@ -0,0 +1,81 @@
+"""
+Benchmark: pooled keep-alive Airtable session vs a new connection per request
+Runs against a local stand-in for the Airtable API that sleeps on every new TCP connection, in place
+of the TCP and TLS handshakes a real new connection to api.airtable.com costs.
+
+    python benchmark_airtable_session.py [requests] [connect_delay_ms]
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubAirtableHandler(BaseHTTPRequestHandler):
+    """Answers every list request with one empty page"""
+    protocol_version = "HTTP/1.1"  # Keep-alive, like Airtable
+    disable_nagle_algorithm = True  # Headers and body are written separately
+
+    def do_GET(self):
+        body = json.dumps({"records": []}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SlowConnectServer(ThreadingHTTPServer):
+    daemon_threads = True
+    connect_delay = 0.01
+
+    def get_request(self):
+        connection = super().get_request()
+        time.sleep(self.connect_delay)
+        return connection
+
+
+def start_stub(connect_delay: float) -> str:
+    server = SlowConnectServer(("127.0.0.1", 0), StubAirtableHandler)
+    server.connect_delay = connect_delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v0"
+
+
+def time_requests(get, count: int) -> float:
+    """Average seconds per request over count sequential GETs"""
+    started = time.perf_counter()
+    for _ in range(count):
+        get().raise_for_status()
+    return (time.perf_counter() - started) / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    connect_delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+
+    # airtable_client reads the endpoint and the rate limits when it is imported
+    os.environ["AIRTABLE_API_URL"] = start_stub(connect_delay)
+    os.environ.setdefault("AIRTABLE_RATE_LIMIT", "1000000")
+    import requests
+    import airtable_client
+
+    url = airtable_client.table_url("appBenchmark", "Imported table")
+    headers = airtable_client.auth_headers("benchmark")
+    params = {"pageSize": 1}
+
+    print(f"⏱️ {count} sequential GETs, {connect_delay * 1000:.0f} ms per new connection")
+    unpooled = time_requests(lambda: requests.get(url, headers=headers, params=params), count)
+    print(f"   New connection per request: {unpooled * 1000:.2f} ms/request")
+    pooled = time_requests(lambda: airtable_client.request("GET", url, headers=headers, params=params), count)
+    print(f"   Pooled keep-alive session:  {pooled * 1000:.2f} ms/request ({unpooled / pooled:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: pooled SMTP sessions vs a new connection per message
+Runs against a local stand-in SMTP server that sleeps on every new connection, in place of the TLS
+handshake and AUTH round trips a real new session to Zoho costs.
+
+    python benchmark_smtp_pool.py [messages] [connect_delay_ms] [threads]
+"""
+
+import smtplib
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from email_senders import SMTPPool, build_message
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib.send_message: greet, accept every command and swallow DATA"""
+    connect_delay = 0.0
+    received = 0
+    lock = threading.Lock()
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        time.sleep(self.connect_delay)
+        self.reply("220 localhost stub ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("EHLO"):
+                self.wfile.write(b"250-localhost\r\n250 8BITMIME\r\n")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with self.lock:
+                    StubSMTPHandler.received += 1
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_stub(connect_delay: float) -> int:
+    StubSMTPHandler.connect_delay = connect_delay
+    server = StubSMTPServer(("127.0.0.1", 0), StubSMTPHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def time_sends(send, messages, threads: int) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(send, messages))
+    return time.perf_counter() - started
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    connect_delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    port = start_stub(connect_delay)
+    messages = [build_message("sender@example.com", f"lead{i}@example.com", "Quick question", "Hello " * 50)
+                for i in range(count)]
+
+    def send_unpooled(message):
+        with smtplib.SMTP("127.0.0.1", port) as smtp:
+            smtp.send_message(message)
+
+    print(f"⏱️ {count} messages from {threads} threads, {connect_delay * 1000:.0f} ms per new connection")
+    unpooled = time_sends(send_unpooled, messages, threads)
+    print(f"   New connection per message: {unpooled:.2f}s ({count / unpooled:.0f} msg/s)")
+
+    pool = SMTPPool("127.0.0.1", port, size=threads, security="none")
+    pooled = time_sends(pool.send, messages, threads)
+    pool.close()
+    stats = pool.stats()
+    print(f"   Pooled sessions:            {pooled:.2f}s ({count / pooled:.0f} msg/s), "
+          f"{stats['connections']} connections for {stats['messages']} messages")
+    print(f"📬 Stub server received {StubSMTPHandler.received}/{2 * count} messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Bulk demo brief generation
+Records are fetched with batched reads, briefs are generated by a bounded worker pool, and the results
+are written back with batched PATCHes. Every record gets a status and timing in the result.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+import airtable_client
+
+load_dotenv()
+
+BRIEF_WORKERS = int(os.getenv("BRIEF_WORKERS", "4"))
+READ_BATCH_SIZE = 50  # Record IDs per filterByFormula; keeps the query string well under URL limits
+FINGERPRINT_FIELD = "Brief Fingerprint"
+BRIEF_MIN_WORDS = int(os.getenv("BRIEF_MIN_WORDS", "80"))  # Shorter briefs escalate to a larger model
+RECORD_ID_PATTERN = re.compile(r"^rec[A-Za-z0-9]{14}$")
+
+
+def valid_brief(brief: str) -> bool:
+    """Briefs are asked for at ~200 words; much shorter output means the model fell short"""
+    return len(brief.split()) >= BRIEF_MIN_WORDS
+
+
+def fingerprint(prompt: str, model: str) -> str:
+    """Identity of a brief's inputs; a stored brief with the same fingerprint can be reused as is"""
+    return hashlib.sha256(json.dumps([model, prompt], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def reusable_brief(fields: Dict, current_fingerprint: str) -> Optional[str]:
+    """The stored brief when it was generated from exactly these inputs, else None"""
+    if fields.get(FINGERPRINT_FIELD) == current_fingerprint and fields.get("Demo Brief"):
+        return fields["Demo Brief"]
+    return None
+
+
+def valid_record_id(record_id) -> bool:
+    """True for a string shaped like an Airtable record ID (rec plus 14 letters and digits)"""
+    return isinstance(record_id, str) and RECORD_ID_PATTERN.match(record_id) is not None
+
+
+def formula_string(value: str) -> str:
+    """value as a single-quoted Airtable formula string literal"""
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def record_id_formula(record_ids: List[str]) -> str:
+    """filterByFormula selecting the given record IDs"""
+    return "OR(" + ",".join(f"RECORD_ID()={formula_string(record_id)}" for record_id in record_ids) + ")"
+
+
+def fetch_records(url: str, headers: Dict, record_ids: Optional[List[str]] = None,
+                  formula: Optional[str] = None, max_records: Optional[int] = None) -> List[Dict]:
+    """Read records by ID in chunks of READ_BATCH_SIZE, or at most max_records records matching a formula"""
+    if record_ids is None:
+        return list(airtable_client.iter_records(url, headers, formula=formula, max_records=max_records))
+
+    records = []
+    for start in range(0, len(record_ids), READ_BATCH_SIZE):
+        chunk = record_ids[start:start + READ_BATCH_SIZE]
+        records.extend(airtable_client.iter_records(url, headers, formula=record_id_formula(chunk)))
+    return records
+
+
+def _with_fingerprint(fields: Dict, result: Dict) -> Dict:
+    if "fingerprint" in result:
+        return {**fields, FINGERPRINT_FIELD: result["fingerprint"]}
+    return fields
+
+
+def generate_briefs(url: str, headers: Dict, generate: Callable[[Dict], str],
+                    brief_fields: Callable[[str], Dict], record_ids: Optional[List[str]] = None,
+                    formula: Optional[str] = None, workers: int = BRIEF_WORKERS,
+                    fingerprint_for: Optional[Callable[[Dict], str]] = None, force: bool = False,
+                    max_records: Optional[int] = None) -> Dict:
+    """Generate and save briefs for many leads; returns a summary with one result per record
+
+    generate(fields, refresh=...) turns a lead's fields into brief text and brief_fields turns the
+    brief into the Airtable fields to write. With fingerprint_for, a lead whose stored fingerprint
+    still matches keeps its brief without calling the LLM unless force is set. force also passes
+    refresh=True to generate so it bypasses the completion cache. A formula selects at most
+    max_records records. Result statuses are "generated",
+    "reused", "generation_failed", "write_failed" and "not_found".
+    """
+    started = time.perf_counter()
+    if record_ids is not None:
+        record_ids = list(dict.fromkeys(record_ids))  # Drop duplicates, keep order
+    records = fetch_records(url, headers, record_ids=record_ids, formula=formula, max_records=max_records)
+    read_seconds = time.perf_counter() - started
+
+    def run(record: Dict) -> Dict:
+        fields = record.get("fields", {})
+        result = {"recordId": record["id"], "leadName": fields.get("Lead Name", "")}
+        generation_started = time.perf_counter()
+        if fingerprint_for is not None:
+            result["fingerprint"] = fingerprint_for(fields)
+            stored = None if force else reusable_brief(fields, result["fingerprint"])
+            if stored is not None:
+                result.update(brief=stored, status="reused", seconds=0.0)
+                return result
+        try:
+            result["brief"] = generate(fields, refresh=force)
+            result["status"] = "generated"
+        except Exception as e:
+            result["status"] = "generation_failed"
+            result["error"] = str(e)
+        result["seconds"] = round(time.perf_counter() - generation_started, 3)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(run, records))
+
+    # One PATCH per BATCH_SIZE briefs; a failed chunk only fails its own records
+    generated = [result for result in results if result["status"] == "generated"]
+    write_started = time.perf_counter()
+    for start in range(0, len(generated), airtable_client.BATCH_SIZE):
+        chunk = generated[start:start + airtable_client.BATCH_SIZE]
+        try:
+            airtable_client.batch_write("PATCH", url, headers, [
+                {"id": result["recordId"], "fields": _with_fingerprint(brief_fields(result["brief"]), result)}
+                for result in chunk
+            ])
+        except Exception as e:
+            for result in chunk:
+                result["status"] = "write_failed"
+                result["error"] = str(e)
+    write_seconds = time.perf_counter() - write_started
+
+    found = {result["recordId"] for result in results}
+    results.extend({"recordId": record_id, "status": "not_found"}
+                   for record_id in record_ids or [] if record_id not in found)
+
+    return {
+        "total": len(results),
+        "generated": sum(1 for result in results if result["status"] == "generated"),
+        "reused": sum(1 for result in results if result["status"] == "reused"),
+        "failed": sum(1 for result in results if result["status"] not in ("generated", "reused")),
+        "timing": {
+            "read_seconds": round(read_seconds, 3),
+            "write_seconds": round(write_seconds, 3),
+            "total_seconds": round(time.perf_counter() - started, 3)
+        },
+        "results": results
+    }
@@ -0,0 +1,258 @@
+"""
+Outbound email senders
+SMTP sends reuse a small pool of authenticated connections, so the TLS handshake and AUTH are paid once
+per connection instead of once per message. The Gmail API sender is authenticated once per account and
+can send many messages in one batched HTTP request.
+"""
+
+import base64
+import os
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional
+
+import httplib2
+from dotenv import load_dotenv
+from google.auth.exceptions import GoogleAuthError
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+load_dotenv()
+
+# Configuration
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))  # Authenticated connections kept open per server
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "50"))  # Zoho drops long sessions
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))  # Servers close idle sessions; reconnect before they do
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+GMAIL_SERVICE_ACCOUNT_FILE = os.getenv("GMAIL_SERVICE_ACCOUNT_FILE", "gmail-service.json")
+GMAIL_SENDER = os.getenv("GMAIL_SENDER")  # Mailbox the service account sends as (domain-wide delegation)
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))  # Google allows 100 per batch but advises at most 50
+GMAIL_SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
+
+# The server rejected this message but the session is still usable
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+# Failures that are an explicit answer from the provider, or that happen before anything was sent
+REFUSALS = (smtplib.SMTPResponseException, HttpError, GoogleAuthError, httplib2.ServerNotFoundError,
+            ConnectionRefusedError)
+
+
+class DeliveryUnknown(Exception):
+    """The message was handed over but the exchange broke off, so the provider may have accepted it"""
+
+
+def after_handover(error: Exception) -> Exception:
+    """The error to report for a failure once the message was handed to the provider
+
+    Timeouts and dropped connections become DeliveryUnknown; explicit refusals are kept as they are.
+    """
+    if isinstance(error, (REFUSALS, DeliveryUnknown)):
+        return error
+    unknown = DeliveryUnknown(f"no answer from the server after sending ({error!r})")
+    unknown.__cause__ = error
+    return unknown
+
+
+def build_message(sender: str, to: str, subject: str, body: str) -> MIMEMultipart:
+    """Plain-text email ready for SMTP or the Gmail API"""
+    message = MIMEMultipart()
+    if sender:
+        # Gmail fills in the authenticated mailbox when there is no From header
+        message["From"] = sender
+    message["To"] = to
+    message["Subject"] = subject
+    message.attach(MIMEText(body, "plain"))
+    return message
+
+
+def default_security(port: int) -> str:
+    """Implicit TLS on 465 (the old behaviour), STARTTLS on any other port"""
+    return "ssl" if port == 465 else "starttls"
+
+
+class _Connection:
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            # Already dropped by the server; nothing left to clean up
+            self.smtp.close()
+
+
+class SMTPPool:
+    """Up to size authenticated SMTP sessions shared by every sending thread
+
+    A session is replaced after max_messages messages or idle_timeout idle seconds. A message whose
+    reused session turns out to have been dropped by the server is retried once on a fresh one.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 size: int = SMTP_POOL_SIZE, max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION,
+                 security: Optional[str] = None, idle_timeout: float = SMTP_IDLE_TIMEOUT,
+                 timeout: float = SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_messages = max_messages
+        self.security = security or os.getenv("SMTP_SECURITY") or default_security(port)
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle: List[_Connection] = []
+        self._slots = threading.BoundedSemaphore(max(1, size))
+        self._lock = threading.Lock()
+        self._stats = {"connections": 0, "messages": 0, "reconnects": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _connect(self) -> _Connection:
+        if self.security == "ssl":
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.security == "starttls":
+                smtp.starttls()
+        try:
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._count("connections")
+        return _Connection(smtp)
+
+    def _checkout(self) -> _Connection:
+        """A live session for the calling thread; blocks while all size sessions are in use"""
+        self._slots.acquire()
+        try:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is not None and time.monotonic() - connection.last_used > self.idle_timeout:
+                connection.close()
+                connection = None
+            return connection or self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, connection: _Connection, broken: bool = False):
+        if broken or connection.sent >= self.max_messages:
+            connection.close()
+        else:
+            connection.last_used = time.monotonic()
+            with self._lock:
+                self._idle.append(connection)
+        self._slots.release()
+
+    def send(self, message: MIMEMultipart):
+        """Send one message; raises on failure, DeliveryUnknown if the session broke off mid-send"""
+        for attempt in range(2):
+            connection = self._checkout()
+            reused = connection.sent > 0
+            try:
+                connection.smtp.send_message(message)
+            except smtplib.SMTPServerDisconnected as e:
+                self._checkin(connection, broken=True)
+                # A fresh session that drops us is a real failure; a stale one just timed out
+                if not reused or attempt:
+                    raise after_handover(e)
+                self._count("reconnects")
+                continue
+            except MESSAGE_ERRORS:
+                self._checkin(connection)
+                raise
+            except Exception as e:
+                self._checkin(connection, broken=True)
+                raise after_handover(e)
+            connection.sent += 1
+            self._count("messages")
+            self._checkin(connection)
+            return
+
+    def close(self):
+        """Log out of every idle session"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Sessions opened, messages sent and reconnects after a dropped session"""
+        with self._lock:
+            return dict(self._stats)
+
+
+class GmailSender:
+    """Gmail API sender sharing one set of service account credentials
+
+    httplib2 connections are not thread-safe, so each sending thread builds its own service object
+    from the shared credentials on first use.
+    """
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self._local = threading.local()
+
+    @classmethod
+    def from_service_account(cls, path: str = GMAIL_SERVICE_ACCOUNT_FILE,
+                             sender: Optional[str] = GMAIL_SENDER) -> "GmailSender":
+        credentials = service_account.Credentials.from_service_account_file(path, scopes=GMAIL_SCOPES)
+        if sender:
+            credentials = credentials.with_subject(sender)
+        return cls(credentials)
+
+    def service(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._local.service = build("gmail", "v1", credentials=self.credentials,
+                                                  cache_discovery=False)
+        return service
+
+    def _send_request(self, service, message: MIMEMultipart):
+        raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        return service.users().messages().send(userId="me", body={"raw": raw})
+
+    def send(self, message: MIMEMultipart) -> str:
+        """Send one message and return its Gmail message ID; raises on failure, DeliveryUnknown on a timeout"""
+        request = self._send_request(self.service(), message)
+        try:
+            return request.execute()["id"]
+        except Exception as e:
+            raise after_handover(e)
+
+    def send_batch(self, messages: Dict[str, MIMEMultipart],
+                   batch_size: int = GMAIL_BATCH_SIZE) -> Dict[str, Optional[Exception]]:
+        """Send messages keyed by e.g. lead record ID, batch_size per HTTP round trip
+
+        Returns the same keys mapped to None for a sent message or the exception for a failed one.
+        """
+        service = self.service()
+        results: Dict[str, Optional[Exception]] = {}
+
+        def callback(key, response, exception):
+            results[key] = exception
+
+        keys = list(messages)
+        for start in range(0, len(keys), batch_size):
+            chunk = keys[start:start + batch_size]
+            batch = service.new_batch_http_request(callback=callback)
+            for key in chunk:
+                batch.add(self._send_request(service, messages[key]), request_id=key)
+            try:
+                batch.execute()
+            except Exception as e:
+                # The whole round trip failed; none of the chunk's callbacks ran
+                for key in chunk:
+                    results.setdefault(key, after_handover(e))
+        return results
+
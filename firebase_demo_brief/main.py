@@ -1,9 +1,21 @@
 from flask import Flask, request, jsonify
 import openai
 import os
+import sys
 from airtable import Airtable
 from dotenv import load_dotenv
 
+try:
+    import bulk_briefs
+    import llm_client
+    import prompt_templates
+except ImportError:
+    # Running from the repository checkout rather than a deployed function bundle
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import bulk_briefs
+    import llm_client
+    import prompt_templates
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -22,26 +34,9 @@ def generate_brief():
     record = at.get(record_id)
     f = record['fields']
 
-    prompt = f"""
-Generate a 200-word demo briefing for Jayashree at Niya to pitch to the following B2B lead:
-
-- Lead Name: {f.get('Lead Name', '')}
-- Role: {f.get('Role', '')}
-- Company: {f.get('Company Name', '')}
-- Industry: {f.get('Industry', '')}
-- Company Size: {f.get('Company Size', '')}
-- Website/LinkedIn: {f.get('Website/LinkedIn', '')}
-- Notes/Objections: {f.get('Notes/Objections', '')}
-- Reply Type: {f.get('Reply Type', '')}
-
-Output: Company summary, likely concerns, and pitch angle for Niya.
-"""
-    res = openai.ChatCompletion.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}]
-    )
-
-    brief = res.choices[0].message.content.strip()
+    prompt = prompt_templates.get("demo_brief").render(f)
+    brief = llm_client.routed_completion(openai.ChatCompletion.create, prompt, "brief",
+                                         bulk_briefs.valid_brief, site="demo_brief")
     at.update(record_id, {"Demo Brief": brief})
     return jsonify({"status": "success", "brief": brief})
 
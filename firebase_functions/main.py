@@ -1,11 +1,24 @@
 import os
+import sys
 import json
-import requests
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from openai import OpenAI
 from dotenv import load_dotenv
 
+try:
+    import airtable_client
+    import bulk_briefs
+    import llm_client
+    import prompt_templates
+except ImportError:
+    # Running from the repository checkout rather than a deployed functions/ directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import airtable_client
+    import bulk_briefs
+    import llm_client
+    import prompt_templates
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -14,6 +27,7 @@ app = Flask(__name__)
 AIRTABLE_TOKEN = os.getenv("AIRTABLE_TOKEN")
 LEADS_BASE_ID = os.getenv("LEADS_BASE_ID", "appzukRazDqAm3RwI")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+MAX_BULK_RECORDS = int(os.getenv("MAX_BULK_RECORDS", "500"))  # Leads one /generate-briefs call may cover
 
 # Initialize OpenAI
 openai = OpenAI(api_key=OPENAI_API_KEY)
@@ -23,16 +37,14 @@ class AirtableAPI:
         self.base_id = base_id
         self.table_name = table_name
         self.token = token
-        self.base_url = f"https://api.airtable.com/v0/{base_id}/{table_name}"
-        self.headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
+        # All requests go through the shared pooled session in airtable_client
+        self.base_url = airtable_client.table_url(base_id, table_name)
+        self.headers = airtable_client.auth_headers(token)
     
     def get_record(self, record_id: str):
         """Get a specific record from Airtable"""
         url = f"{self.base_url}/{record_id}"
-        response = requests.get(url, headers=self.headers)
+        response = airtable_client.request("GET", url, headers=self.headers)
         response.raise_for_status()
         return response.json()
     
@@ -41,43 +53,98 @@ class AirtableAPI:
         url = f"{self.base_url}/{record_id}"
         payload = {"fields": fields}
         
-        response = requests.patch(url, headers=self.headers, json=payload)
+        response = airtable_client.request("PATCH", url, headers=self.headers, json=payload)
         response.raise_for_status()
         
         return response.json()
 
-def generate_demo_brief(lead_data):
-    """Generate a demo brief using GPT-4"""
-    prompt = f"""
-Generate a 200-word demo briefing for Jayashree at Niya to pitch to the following B2B lead:
-
-- Lead Name: {lead_data.get('Lead Name', '')}
-- Role: {lead_data.get('Role', '')}
-- Company: {lead_data.get('Company Name', '')}
-- Industry: {lead_data.get('Industry', '')}
-- Company Size: {lead_data.get('Company Size', '')}
-- Website/LinkedIn: {lead_data.get('Website/LinkedIn', '')}
-- Notes/Objections: {lead_data.get('Notes/Objections', '')}
-- Reply Type: {lead_data.get('Reply Type', '')}
-
-The output should include:
-1. Summary of what the company likely does
-2. What the role's top concern might be
-3. A custom angle to pitch Niya's mental fitness bootcamp
-
-Keep it sharp and to the point.
-"""
+def flag(value):
+    """A true/false switch from a query string or JSON body: true, "true" and "1" are on"""
+    return value is True or str(value).lower() in ('1', 'true')
+
+def demo_brief_prompt(lead_data):
+    """Build the demo brief prompt for a lead"""
+    return prompt_templates.get("demo_brief").render(lead_data)
+
+def brief_fingerprint(lead_data):
+    """Fingerprint of everything the brief depends on: the model route and the filled-in prompt"""
+    return bulk_briefs.fingerprint(demo_brief_prompt(lead_data), ",".join(llm_client.models_for("brief")))
+
+def write_demo_brief(lead_data, refresh=False):
+    """Generate a demo brief, escalating to a larger model if it comes out too short; raises on failure
+    
+    refresh skips the completion cache, so a forced regeneration really calls OpenAI.
+    """
+    return llm_client.routed_completion(
+        openai.chat.completions.create, demo_brief_prompt(lead_data), "brief", bulk_briefs.valid_brief,
+        max_tokens=400,
+        temperature=0.7,
+        site="demo_brief",
+        refresh=refresh
+    )
+
+def brief_fields(brief):
+    """Airtable fields recording a generated brief"""
+    return {
+        "Demo Brief": brief,
+        "Brief Generated": True,
+        "Brief Generated Date": datetime.now().isoformat()
+    }
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def brief_response(record_id, lead_data, brief, reused=False):
+    """JSON payload returned for a generated or reused brief"""
+    return {
+        "success": True,
+        "recordId": record_id,
+        "leadName": lead_data.get('Lead Name', ''),
+        "companyName": lead_data.get('Company Name', ''),
+        "brief": brief,
+        "reused": reused,
+        "timestamp": datetime.now().isoformat()
+    }
+
+def stream_demo_brief(airtable, record_id, lead_data, fingerprint, stored_brief=None, refresh=False):
+    """Yield the brief as Server-Sent Events while GPT-4 writes it, then save it to Airtable"""
+    yield sse_event("start", {"recordId": record_id, "leadName": lead_data.get('Lead Name', '')})
+    
+    if stored_brief is not None:
+        yield sse_event("done", brief_response(record_id, lead_data, stored_brief, reused=True))
+        return
     
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=400,
-            temperature=0.7
-        )
-        return response.choices[0].message.content.strip()
+        models = llm_client.models_for("brief")
+        for i, model in enumerate(models):
+            parts = []
+            for text in llm_client.stream_chat_completion(
+                openai.chat.completions.create, demo_brief_prompt(lead_data),
+                model=model,
+                max_tokens=400,
+                temperature=0.7,
+                site=f"demo_brief_stream:{model}",
+                refresh=refresh
+            ):
+                parts.append(text)
+                yield sse_event("chunk", {"text": text})
+            brief = "".join(parts).strip()
+            if i == len(models) - 1 or bulk_briefs.valid_brief(brief):
+                break
+            # Tell the client to discard what it has shown; a larger model writes the brief again
+            yield sse_event("reset", {"reason": "brief failed validation", "model": models[i + 1]})
+        
+        # Only a complete brief is written back
+        airtable.update(record_id, {**brief_fields(brief), bulk_briefs.FINGERPRINT_FIELD: fingerprint})
+        
+        yield sse_event("done", brief_response(record_id, lead_data, brief))
     except Exception as e:
-        return f"Error generating brief: {str(e)}"
+        yield sse_event("error", {
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        })
 
 @app.route('/generate-brief', methods=['GET', 'POST'])
 def generate_brief_endpoint():
@@ -86,9 +153,12 @@ def generate_brief_endpoint():
         # Get record ID from query parameters or request body
         if request.method == 'GET':
             record_id = request.args.get('recordId')
+            force = flag(request.args.get('force'))
         else:
             data = request.get_json()
             record_id = data.get('recordId')
+            force = flag(data.get('force')) or flag(request.args.get('force'))
+        stream = flag(request.args.get('stream'))
         
         if not record_id:
             return jsonify({
@@ -103,22 +173,85 @@ def generate_brief_endpoint():
         record = airtable.get_record(record_id)
         lead_data = record['fields']
         
-        # Generate the demo brief
-        brief = generate_demo_brief(lead_data)
+        # Repeated clicks on an unchanged lead return the stored brief without calling OpenAI
+        fingerprint = brief_fingerprint(lead_data)
+        stored_brief = None if force else bulk_briefs.reusable_brief(lead_data, fingerprint)
+        
+        if stream:
+            # Send the brief as it is generated instead of after the whole completion
+            return Response(
+                stream_with_context(stream_demo_brief(airtable, record_id, lead_data, fingerprint, stored_brief,
+                                                   refresh=force)),
+                mimetype='text/event-stream',
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        
+        if stored_brief is not None:
+            return jsonify(brief_response(record_id, lead_data, stored_brief, reused=True))
+        
+        # Generate the demo brief; a failed generation is saved without a fingerprint so it is retried
+        try:
+            brief = write_demo_brief(lead_data, refresh=force)
+            updates = {**brief_fields(brief), bulk_briefs.FINGERPRINT_FIELD: fingerprint}
+        except Exception as e:
+            brief = f"Error generating brief: {str(e)}"
+            updates = brief_fields(brief)
         
         # Update the record with the generated brief
-        airtable.update(record_id, {
-            "Demo Brief": brief,
-            "Brief Generated": True,
-            "Brief Generated Date": datetime.now().isoformat()
-        })
+        airtable.update(record_id, updates)
+        
+        return jsonify(brief_response(record_id, lead_data, brief))
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/generate-briefs', methods=['POST'])
+def generate_briefs_endpoint():
+    """Generate briefs for many leads, given as a list of recordIds or an Airtable formula"""
+    try:
+        data = request.get_json() or {}
+        record_ids = data.get('recordIds')
+        formula = data.get('formula')
+        
+        if not record_ids and not formula:
+            return jsonify({
+                "success": False,
+                "error": "recordIds or formula is required"
+            }), 400
+        if record_ids and (not isinstance(record_ids, list)
+                           or not all(bulk_briefs.valid_record_id(record_id) for record_id in record_ids)):
+            return jsonify({
+                "success": False,
+                "error": "recordIds must be a list of Airtable record IDs"
+            }), 400
+        if formula and not isinstance(formula, str):
+            return jsonify({
+                "success": False,
+                "error": "formula must be a string"
+            }), 400
+        if record_ids and len(record_ids) > MAX_BULK_RECORDS:
+            return jsonify({
+                "success": False,
+                "error": f"At most {MAX_BULK_RECORDS} recordIds per request"
+            }), 400
+        
+        airtable = AirtableAPI(LEADS_BASE_ID, "Leads", AIRTABLE_TOKEN)
+        summary = bulk_briefs.generate_briefs(
+            airtable.base_url, airtable.headers, write_demo_brief, brief_fields,
+            record_ids=record_ids or None,
+            formula=formula,
+            fingerprint_for=brief_fingerprint,
+            force=flag(data.get('force')),
+            max_records=MAX_BULK_RECORDS
+        )
         
         return jsonify({
-            "success": True,
-            "recordId": record_id,
-            "leadName": lead_data.get('Lead Name', ''),
-            "companyName": lead_data.get('Company Name', ''),
-            "brief": brief,
+            "success": summary["failed"] == 0,
+            **summary,
             "timestamp": datetime.now().isoformat()
         })
         
@@ -146,6 +279,8 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "generate_brief": "/generate-brief?recordId=YOUR_RECORD_ID",
+            "generate_brief_stream": "/generate-brief?recordId=YOUR_RECORD_ID&stream=1",
+            "generate_briefs": "POST /generate-briefs with {\"recordIds\": [...]} or {\"formula\": \"...\"}",
             "health": "/health"
         },
         "usage": "Call /generate-brief with recordId parameter to generate a demo brief for a lead"
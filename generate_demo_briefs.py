@@ -1,9 +1,14 @@
 import os
-import requests
+import argparse
 from datetime import datetime
 from openai import OpenAI
 from dotenv import load_dotenv
 
+import airtable_client
+import bulk_briefs
+import llm_client
+import prompt_templates
+
 load_dotenv()
 
 AIRTABLE_TOKEN = os.getenv("AIRTABLE_TOKEN")
@@ -15,30 +20,20 @@ class AirtableAPI:
         self.base_id = base_id
         self.table_name = table_name
         self.token = token
-        self.base_url = f"https://api.airtable.com/v0/{base_id}/{table_name}"
-        self.headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
+        # All requests go through the shared pooled session in airtable_client
+        self.base_url = airtable_client.table_url(base_id, table_name)
+        self.headers = airtable_client.auth_headers(token)
     
     def get_all(self, formula: str = None):
         """Get all records from Airtable"""
-        params = {}
-        if formula:
-            params["filterByFormula"] = formula
-        
-        response = requests.get(self.base_url, headers=self.headers, params=params)
-        response.raise_for_status()
-        
-        data = response.json()
-        return data.get("records", [])
+        return list(airtable_client.iter_records(self.base_url, self.headers, formula=formula))
     
     def update(self, record_id: str, fields: dict):
         """Update a record in Airtable"""
         url = f"{self.base_url}/{record_id}"
         payload = {"fields": fields}
         
-        response = requests.patch(url, headers=self.headers, json=payload)
+        response = airtable_client.request("PATCH", url, headers=self.headers, json=payload)
         response.raise_for_status()
         
         return response.json()
@@ -46,42 +41,50 @@ class AirtableAPI:
 at = AirtableAPI(LEADS_BASE_ID, TABLE, AIRTABLE_TOKEN)
 openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+DEMOS_FORMULA = "AND({Demo Booked?}=TRUE, {Demo Brief}='')"
+
 def fetch_demos():
-    return at.get_all(formula="AND({Demo Booked?}=TRUE, {Demo Brief}='')")
+    return at.get_all(formula=DEMOS_FORMULA)
 
 def generate_brief(lead):
-    f = lead["fields"]
-    prompt = f"""
-Generate a 200-word demo briefing for Jayashree at Niya to pitch to the following B2B lead:
+    return generate_brief_for(lead["fields"])
 
-- Lead Name: {f.get("Lead Name", "")}
-- Role: {f.get("Role", "")}
-- Company: {f.get("Company Name", "")}
-- Industry: {f.get("Industry", "")}
-- Company Size: {f.get("Company Size", "")}
-- Website/LinkedIn: {f.get("Website/LinkedIn", "")}
-- Notes/Objections: {f.get("Notes/Objections", "")}
-- Reply Type: {f.get("Reply Type", "")}
+def brief_prompt(f):
+    return prompt_templates.get("demo_brief").render(f)
 
-The output should include:
-1. Summary of what the company likely does
-2. What the role's top concern might be
-3. A custom angle to pitch Niya's mental fitness bootcamp
+def generate_brief_for(f, refresh=False):
+    return llm_client.routed_completion(openai.chat.completions.create, brief_prompt(f), "brief",
+                                        bulk_briefs.valid_brief, site="demo_brief", refresh=refresh)
 
-Keep it sharp and to the point.
-"""
-    res = openai.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return res.choices[0].message.content.strip()
+def brief_fingerprint(f):
+    return bulk_briefs.fingerprint(brief_prompt(f), ",".join(llm_client.models_for("brief")))
 
 def main():
-    leads = fetch_demos()
-    for lead in leads:
-        brief = generate_brief(lead)
-        at.update(lead['id'], {"Demo Brief": brief})
-        print(f"✅ Brief added for {lead['fields'].get('Lead Name')}")
+    parser = argparse.ArgumentParser(description="Generate demo briefs for booked demos")
+    parser.add_argument("--ids", nargs="+", metavar="RECORD_ID", help="generate briefs for these records")
+    parser.add_argument("--formula", default=DEMOS_FORMULA,
+                        help="Airtable formula selecting the leads (default: booked demos without a brief)")
+    parser.add_argument("--workers", type=int, default=bulk_briefs.BRIEF_WORKERS,
+                        help="briefs generated concurrently")
+    parser.add_argument("--force", action="store_true",
+                        help="regenerate briefs even when the lead has not changed since its brief was written")
+    args = parser.parse_args()
+    
+    summary = bulk_briefs.generate_briefs(
+        at.base_url, at.headers, generate_brief_for, lambda brief: {"Demo Brief": brief},
+        record_ids=args.ids, formula=args.formula, workers=args.workers,
+        fingerprint_for=brief_fingerprint, force=args.force
+    )
+    for result in summary["results"]:
+        if result["status"] == "generated":
+            print(f"✅ Brief added for {result.get('leadName')} ({result['seconds']}s)")
+        elif result["status"] == "reused":
+            print(f"♻️ Brief unchanged for {result.get('leadName')}")
+        else:
+            print(f"❌ {result['recordId']}: {result['status']} {result.get('error', '')}")
+    print(f"📝 {summary['generated']}/{summary['total']} briefs in {summary['timing']['total_seconds']}s")
+    usage = llm_client.get_usage().summary()
+    print(f"💰 {usage['total_tokens']} tokens, ${usage['total_cost_usd']:.4f}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+KPI aggregation for the leads table
+Single-pass counters over streamed records, plus an incremental mode that only reads changed leads
+"""
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+KPI_STATE_FILE = os.getenv("KPI_STATE_FILE", ".niya_kpi_state.json")
+KPI_FULL_REFRESH_DAYS = int(os.getenv("KPI_FULL_REFRESH_DAYS", "7"))
+WATERMARK_SKEW = timedelta(minutes=2)  # Overlap windows so edits made while we read are not missed
+
+# Only these columns are needed to compute the KPI dashboard
+KPI_FIELDS = ["Email Sent?", "Reply Status", "Calendly Clicked", "Demo Booked?", "Follow-up Attempts"]
+KPI_COUNTERS = (
+    "total_leads", "emails_sent", "interested", "later", "not_now", "wrong_person",
+    "meeting_booked", "calendly_clicks", "demos_booked", "follow_up_attempts"
+)
+REPLY_STATUS_COUNTERS = {
+    "Interested": KPI_COUNTERS.index("interested"),
+    "Later": KPI_COUNTERS.index("later"),
+    "Not Now": KPI_COUNTERS.index("not_now"),
+    "Wrong Person": KPI_COUNTERS.index("wrong_person"),
+    "Meeting Booked": KPI_COUNTERS.index("meeting_booked"),
+}
+
+
+def kpi_contribution(fields: Dict) -> List[int]:
+    """How much one lead adds to each counter in KPI_COUNTERS"""
+    contribution = [0] * len(KPI_COUNTERS)
+    contribution[0] = 1
+    contribution[1] = 1 if fields.get('Email Sent?', False) else 0
+    status_index = REPLY_STATUS_COUNTERS.get(fields.get('Reply Status'))
+    if status_index is not None:
+        contribution[status_index] = 1
+    contribution[7] = 1 if fields.get('Calendly Clicked', False) else 0
+    contribution[8] = 1 if fields.get('Demo Booked?', False) else 0
+    contribution[9] = fields.get('Follow-up Attempts', 0) or 0
+    return contribution
+
+
+def aggregate_kpis(records: Iterable[Dict]) -> Dict[str, int]:
+    """Sum every KPI counter over a record stream in one pass"""
+    totals = [0] * len(KPI_COUNTERS)
+    for record in records:
+        for index, value in enumerate(kpi_contribution(record['fields'])):
+            totals[index] += value
+    return dict(zip(KPI_COUNTERS, totals))
+
+
+def build_kpi_report(counts: Dict[str, int]) -> Dict:
+    """Turn raw counters into the nested KPI report used by the dashboard and log_kpis"""
+    emails_sent = counts["emails_sent"]
+    calendly_clicks = counts["calendly_clicks"]
+    demos_booked = counts["demos_booked"]
+    follow_up_attempts = counts["follow_up_attempts"]
+    replies = counts["interested"] + counts["later"] + counts["meeting_booked"]
+
+    return {
+        "total_leads": counts["total_leads"],
+        "emails_sent": emails_sent,
+        "reply_breakdown": {
+            "interested": counts["interested"],
+            "later": counts["later"],
+            "not_now": counts["not_now"],
+            "wrong_person": counts["wrong_person"],
+            "meeting_booked": counts["meeting_booked"]
+        },
+        "calendly_metrics": {
+            "clicks": calendly_clicks,
+            "demos_booked": demos_booked,
+            "conversion_rate": (demos_booked / calendly_clicks * 100) if calendly_clicks > 0 else 0
+        },
+        "follow_up_metrics": {
+            "total_attempts": follow_up_attempts,
+            "avg_attempts_per_lead": follow_up_attempts / emails_sent if emails_sent > 0 else 0
+        },
+        "overall_rates": {
+            "reply_rate": (replies / emails_sent * 100) if emails_sent > 0 else 0,
+            "meeting_rate": (counts["meeting_booked"] / emails_sent * 100) if emails_sent > 0 else 0,
+            "demo_rate": (demos_booked / emails_sent * 100) if emails_sent > 0 else 0
+        }
+    }
+
+
+def modified_since_formula(watermark: str) -> str:
+    """filterByFormula selecting records changed after an ISO-8601 UTC watermark"""
+    return f"IS_AFTER(LAST_MODIFIED_TIME(), DATETIME_PARSE('{watermark}'))"
+
+
+class KPIState:
+    """KPI counters persisted between runs with a LAST_MODIFIED_TIME() watermark
+
+    Each lead's last contribution is kept so a changed lead can be swapped out of the totals.
+    Deleted leads cannot be seen through a modified-time filter, so the state is rebuilt from a
+    full scan every KPI_FULL_REFRESH_DAYS.
+    """
+
+    def __init__(self, path: str = KPI_STATE_FILE):
+        self.path = path
+        self.watermark: Optional[str] = None
+        self.full_scan_at: Optional[str] = None
+        self.totals: List[int] = [0] * len(KPI_COUNTERS)
+        self.contributions: Dict[str, List[int]] = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("counters") != list(KPI_COUNTERS):
+                return  # Counter layout changed; start over with a full scan
+            self.watermark = state["watermark"]
+            self.full_scan_at = state["full_scan_at"]
+            self.totals = state["totals"]
+            self.contributions = state["contributions"]
+        except (ValueError, KeyError) as e:
+            print(f"⚠️ Ignoring unreadable KPI state {self.path}: {e}")
+
+    def _save(self):
+        state = {
+            "counters": list(KPI_COUNTERS),
+            "watermark": self.watermark,
+            "full_scan_at": self.full_scan_at,
+            "totals": self.totals,
+            "contributions": self.contributions
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def _needs_full_scan(self, now: datetime) -> bool:
+        if not self.watermark or not self.full_scan_at:
+            return True
+        last_full = datetime.fromisoformat(self.full_scan_at.replace("Z", "+00:00"))
+        return now - last_full >= timedelta(days=KPI_FULL_REFRESH_DAYS)
+
+    def refresh(self, fetch: Callable[[Optional[str]], Iterable[Dict]]) -> Dict[str, int]:
+        """Bring the counters up to date; fetch(formula) must stream records with KPI_FIELDS"""
+        now = datetime.now(timezone.utc)
+        watermark = (now - WATERMARK_SKEW).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+        if self._needs_full_scan(now):
+            print("📊 Rebuilding KPI state from a full scan...")
+            self.totals = [0] * len(KPI_COUNTERS)
+            self.contributions = {}
+            records = fetch(None)
+            self.full_scan_at = now.isoformat()
+        else:
+            records = fetch(modified_since_formula(self.watermark))
+
+        changed = 0
+        for record in records:
+            new = kpi_contribution(record['fields'])
+            old = self.contributions.get(record['id'])
+            for index, value in enumerate(new):
+                self.totals[index] += value - (old[index] if old else 0)
+            self.contributions[record['id']] = new
+            changed += 1
+
+        self.watermark = watermark
+        self._save()
+        print(f"📊 Applied {changed} changed leads to KPI state")
+        return dict(zip(KPI_COUNTERS, self.totals))
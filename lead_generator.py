@@ -6,7 +6,6 @@ Scrapes startups, enriches with LinkedIn profiles, and uploads to Airtable
 
 import os
 import csv
-import time
 import requests
 import urllib.parse
 from bs4 import BeautifulSoup
@@ -14,6 +13,9 @@ from datetime import datetime
 from dotenv import load_dotenv
 import json
 
+import airtable_client
+import rate_limiter
+
 load_dotenv()
 
 # Configuration
@@ -39,6 +41,7 @@ class LeadGenerator:
                 url = f"https://inc42.com/startups/page/{page}/"
                 print(f"📄 Scraping page {page}...")
                 
+                rate_limiter.acquire("scrape:inc42.com")
                 response = requests.get(url, headers=self.headers, timeout=10)
                 response.raise_for_status()
                 soup = BeautifulSoup(response.content, "html.parser")
@@ -77,9 +80,6 @@ class LeadGenerator:
                         print(f"⚠️ Error parsing article: {e}")
                         continue
                 
-                # Rate limiting
-                time.sleep(2)
-                
             except Exception as e:
                 print(f"❌ Error scraping page {page}: {e}")
                 continue
@@ -150,9 +150,6 @@ class LeadGenerator:
                         best_role = role
                         break
                     
-                    # Rate limiting
-                    time.sleep(1)
-                    
                 except Exception as e:
                     print(f"⚠️ Error searching for {role}: {e}")
                     continue
@@ -160,9 +157,6 @@ class LeadGenerator:
             company['LinkedIn Profile'] = best_profile
             company['Target Role'] = best_role
             enriched_companies.append(company)
-            
-            # Rate limiting between companies
-            time.sleep(2)
         
         print(f"✅ Enriched {len(enriched_companies)} companies with LinkedIn profiles")
         return enriched_companies
@@ -170,6 +164,8 @@ class LeadGenerator:
     def google_search_linkedin(self, company, role):
         """Search Google for LinkedIn profiles"""
         try:
+            # Block only as long as the Google search budget requires
+            rate_limiter.acquire("google_search")
             query = f"site:linkedin.com/in {role} {company}"
             url = f"https://www.google.com/search?q={urllib.parse.quote_plus(query)}"
             
@@ -250,48 +246,36 @@ class LeadGenerator:
             print("❌ Airtable credentials not configured")
             return False
         
-        headers = {
-            "Authorization": f"Bearer {AIRTABLE_TOKEN}",
-            "Content-Type": "application/json"
-        }
+        headers = airtable_client.auth_headers(AIRTABLE_TOKEN)
         
-        url = f"https://api.airtable.com/v0/{LEADS_BASE_ID}/Imported table"
+        url = airtable_client.table_url(LEADS_BASE_ID, "Imported table")
         
-        uploaded_count = 0
+        # Prepare lead data for Airtable
+        records = [{
+            "fields": {
+                "Company Name": company.get("Company Name", ""),
+                "Website/LinkedIn": company.get("LinkedIn Profile", ""),
+                "Industry": "Technology",  # Default for startups
+                "Company Size": "1-50 employees",  # Default for startups
+                "Role": company.get("Target Role", "CEO"),
+                "Email": company.get("Primary Email", ""),
+                "Email Sent?": "FALSE",
+                "Status": "New Lead",
+                "Notes/Objections": f"Source: {company.get('Source', 'Unknown')}. {company.get('Description', '')}"
+            }
+        } for company in companies]
         
-        for company in companies:
-            try:
-                # Prepare lead data for Airtable
-                lead_data = {
-                    "records": [{
-                        "fields": {
-                            "Company Name": company.get("Company Name", ""),
-                            "Website/LinkedIn": company.get("LinkedIn Profile", ""),
-                            "Industry": "Technology",  # Default for startups
-                            "Company Size": "1-50 employees",  # Default for startups
-                            "Role": company.get("Target Role", "CEO"),
-                            "Email": company.get("Primary Email", ""),
-                            "Email Sent?": "FALSE",
-                            "Status": "New Lead",
-                            "Notes/Objections": f"Source: {company.get('Source', 'Unknown')}. {company.get('Description', '')}"
-                        }
-                    }]
-                }
-                
-                response = requests.post(url, headers=headers, json=lead_data)
-                
-                if response.status_code == 200:
-                    uploaded_count += 1
-                    print(f"✅ Uploaded: {company['Company Name']}")
-                else:
-                    print(f"❌ Failed to upload {company['Company Name']}: {response.status_code}")
-                
-                # Rate limiting
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"❌ Error uploading {company['Company Name']}: {e}")
-                continue
+        # batch_write sends 10 records per request (Airtable's maximum) and stops at the first failed request
+        try:
+            created = airtable_client.batch_write("POST", url, headers, records)
+        except Exception as e:
+            print(f"❌ Error uploading leads: {e}")
+            print("⚠️ Leads in the requests before the failed one were uploaded; check Airtable before re-running")
+            return 0
+        
+        uploaded_count = len(created)
+        for record in created:
+            print(f"✅ Uploaded: {record['fields'].get('Company Name', '')}")
         
         print(f"✅ Successfully uploaded {uploaded_count}/{len(companies)} leads to Airtable")
         return uploaded_count
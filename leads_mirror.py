@@ -0,0 +1,164 @@
+"""
+Local SQLite mirror of Airtable tables
+Delta-synced with LAST_MODIFIED_TIME() watermarks so lead selection and analytics can run locally
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from kpis import WATERMARK_SKEW, modified_since_formula
+
+load_dotenv()
+
+LEADS_MIRROR_DB = os.getenv("LEADS_MIRROR_DB", "niya_mirror.db")
+MIRROR_FULL_REFRESH_DAYS = int(os.getenv("MIRROR_FULL_REFRESH_DAYS", "7"))
+SYNC_CHUNK_SIZE = 500  # Rows written per executemany while streaming a sync
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    table_key TEXT NOT NULL,
+    id TEXT NOT NULL,
+    created_time TEXT,
+    fields TEXT NOT NULL,
+    email TEXT NOT NULL DEFAULT '',
+    email_sent INTEGER NOT NULL DEFAULT 0,
+    reply_type TEXT NOT NULL DEFAULT '',
+    last_email_sent TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (table_key, id)
+);
+CREATE INDEX IF NOT EXISTS idx_records_email ON records (table_key, email);
+CREATE INDEX IF NOT EXISTS idx_records_email_sent ON records (table_key, email_sent);
+CREATE INDEX IF NOT EXISTS idx_records_reply_type ON records (table_key, reply_type);
+CREATE INDEX IF NOT EXISTS idx_records_last_email_sent ON records (table_key, last_email_sent);
+CREATE TABLE IF NOT EXISTS sync_state (
+    table_key TEXT PRIMARY KEY,
+    watermark TEXT NOT NULL,
+    full_scan_at TEXT NOT NULL
+);
+"""
+
+# SQL equivalents of NiyaSalesAgent.lead_formula; a missing or unchecked "Email Sent?" counts as FALSE
+STATUS_FILTERS = {
+    "new": "email_sent = 0 AND email != ''",
+    "follow_up": "email_sent = 1 AND last_email_sent != '' AND reply_type = ''",
+    "positive": "reply_type = 'Interested'",
+}
+
+
+def table_key(base_id: str, table_name: str) -> str:
+    return f"{base_id}/{table_name}"
+
+
+def _is_sent(value) -> int:
+    # The column is written both as a checkbox (True) and as "TRUE"/"FALSE" text
+    if isinstance(value, str):
+        return 1 if value.strip().upper() == "TRUE" else 0
+    return 1 if value else 0
+
+
+class LeadsMirror:
+    """SQLite copy of Airtable records with the columns lead selection filters on"""
+
+    def __init__(self, path: str = LEADS_MIRROR_DB):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _row(self, key: str, record: Dict) -> tuple:
+        fields = record.get("fields", {})
+        return (
+            key,
+            record["id"],
+            record.get("createdTime"),
+            json.dumps(fields),
+            fields.get("Email", "") or "",
+            _is_sent(fields.get("Email Sent?")),
+            fields.get("Reply Type", "") or "",
+            fields.get("Last Email Sent", "") or "",
+        )
+
+    def apply_update(self, key: str, record_id: str, updates: Dict):
+        """Write-through for a successful Airtable update so the mirror never lags our own writes"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT created_time, fields FROM records WHERE table_key=? AND id=?", (key, record_id)
+            ).fetchone()
+            if row is None:
+                return
+            fields = {**json.loads(row[1]), **updates}
+            self._db.execute(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self._row(key, {"id": record_id, "createdTime": row[0], "fields": fields})
+            )
+            self._db.commit()
+
+    def sync(self, key: str, api) -> int:
+        """Stream records changed since the last sync from an AirtableAPI; returns how many were stored
+
+        Deleted records are invisible to a modified-time filter, so the table is rebuilt from a full
+        scan when it has never been synced or the last full scan is older than MIRROR_FULL_REFRESH_DAYS.
+        """
+        now = datetime.now(timezone.utc)
+        watermark = (now - WATERMARK_SKEW).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+        with self._lock:
+            state = self._db.execute(
+                "SELECT watermark, full_scan_at FROM sync_state WHERE table_key=?", (key,)
+            ).fetchone()
+        full_scan = state is None or (
+            now - datetime.fromisoformat(state[1]) >= timedelta(days=MIRROR_FULL_REFRESH_DAYS)
+        )
+
+        formula = None if full_scan else modified_since_formula(state[0])
+        stored = 0
+        chunk = []
+
+        # Everything below is one transaction, so a failed sync leaves the previous copy intact
+        try:
+            if full_scan:
+                with self._lock:
+                    self._db.execute("DELETE FROM records WHERE table_key=?", (key,))
+            for record in api.iter_records(formula=formula):
+                chunk.append(self._row(key, record))
+                if len(chunk) >= SYNC_CHUNK_SIZE:
+                    stored += self._insert_rows(chunk)
+                    chunk = []
+            stored += self._insert_rows(chunk)
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+                    (key, watermark, now.isoformat() if full_scan else state[1])
+                )
+                self._db.commit()
+        except Exception:
+            with self._lock:
+                self._db.rollback()
+            raise
+        return stored
+
+    def _insert_rows(self, rows: List[tuple]) -> int:
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def iter_records(self, key: str, status_filter: Optional[str] = None,
+                     fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        """Yield mirrored records in Airtable's shape, filtered like NiyaSalesAgent.lead_formula"""
+        sql = "SELECT id, created_time, fields FROM records WHERE table_key=?"
+        where = STATUS_FILTERS.get(status_filter)
+        if where:
+            sql += f" AND {where}"
+        with self._lock:
+            rows = self._db.execute(sql, (key,)).fetchall()
+        for record_id, created_time, raw_fields in rows:
+            record_fields = json.loads(raw_fields)
+            if fields:
+                record_fields = {k: v for k, v in record_fields.items() if k in fields}
+            yield {"id": record_id, "createdTime": created_time, "fields": record_fields}
@@ -0,0 +1,496 @@
+"""
+Shared wrapper for OpenAI chat completions
+Completions are cached by a hash of (model, messages, temperature, max_tokens) so retries and
+reruns do not pay tokens or latency twice. The cache is an in-memory LRU in front of SQLite.
+Every provider call is counted per call site (tokens, latency, cost) against an optional run budget.
+Tasks are routed to a cheap model first and escalate to larger ones only when the output fails validation.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+import rate_limiter
+
+try:
+    import tiktoken
+except ImportError:
+    # Optional; token counts fall back to rate_limiter's chars/4 estimate
+    tiktoken = None
+
+load_dotenv()
+
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # Seconds; 0 disables caching
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))  # In-memory LRU size
+LLM_CACHE_MAX_DISK_ENTRIES = int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "50000"))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", ".niya_llm_cache.db")  # Empty string keeps the cache in memory only
+LLM_RUN_TOKEN_BUDGET = int(os.getenv("LLM_RUN_TOKEN_BUDGET", "0"))  # Tokens per run; 0 = unlimited
+LLM_FIELD_MAX_TOKENS = int(os.getenv("LLM_FIELD_MAX_TOKENS", "500"))  # Free-text lead fields are cut to this
+LLM_USAGE_REPORT = os.getenv("LLM_USAGE_REPORT", ".niya_llm_usage.json")  # Empty string skips the JSON export
+
+# USD per million (prompt, completion) tokens; the longest matching prefix of the model name wins
+MODEL_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-3.5-turbo": (0.5, 1.5),
+}
+BATCH_DISCOUNT = 0.5  # Batch API requests are billed at half price
+
+# Models tried per task, cheapest first; override with e.g. LLM_ROUTE_COLD_EMAIL="gpt-4o-mini,gpt-4o,gpt-4"
+DEFAULT_ROUTES = {
+    "cold_email": ["gpt-4o-mini", "gpt-4"],
+    "follow_up": ["gpt-4o-mini", "gpt-4"],
+    "classification": ["gpt-4o-mini", "gpt-4"],
+    "brief": ["gpt-4o-mini", "gpt-4"],
+}
+
+
+def models_for(task: str) -> List[str]:
+    """Model escalation ladder for a task"""
+    configured = os.getenv(f"LLM_ROUTE_{task.upper()}")
+    if configured:
+        return [model.strip() for model in configured.split(",") if model.strip()]
+    return DEFAULT_ROUTES.get(task, ["gpt-4"])
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """Raised instead of calling the provider once the run's token budget is spent"""
+
+
+_encodings: Dict[str, object] = {}
+
+
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # The encoding files could not be loaded (e.g. no network on first use)
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Prompt tokens for text, exact when tiktoken is installed"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return rate_limiter.estimate_tokens(text)
+    return len(encoding.encode(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int = LLM_FIELD_MAX_TOKENS, model: str = "gpt-4") -> str:
+    """Cut text to at most max_tokens so one oversized field cannot blow up a prompt"""
+    if not text or count_tokens(text, model) <= max_tokens:
+        return text
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[:max_tokens * 4] + "…"
+    return encoding.decode(encoding.encode(text)[:max_tokens]) + "…"
+
+
+def model_price(model: str) -> tuple:
+    for prefix in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_PRICES[prefix]
+    return (0.0, 0.0)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class UsageTracker:
+    """Tokens, latency and cost per call site, plus the run-wide token budget"""
+
+    def __init__(self, budget: int = LLM_RUN_TOKEN_BUDGET):
+        self.budget = budget
+        self._used = 0
+        self._sites: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _site(self, site: str) -> Dict:
+        if site not in self._sites:
+            self._sites[site] = {"calls": 0, "cached": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                 "cost_usd": 0.0, "latencies": []}
+        return self._sites[site]
+
+    def reserve(self, tokens: int) -> int:
+        """Count a call's estimated tokens against the budget before it is sent"""
+        with self._lock:
+            if self.budget and self._used + tokens > self.budget:
+                raise TokenBudgetExceeded(
+                    f"LLM token budget of {self.budget} would be exceeded ({self._used} used, {tokens} requested)")
+            self._used += tokens
+        return tokens
+
+    def release(self, reserved: int):
+        """Return a reservation for a call that failed"""
+        with self._lock:
+            self._used -= reserved
+
+    def record(self, site: str, model: str, prompt_tokens: int, completion_tokens: int, seconds: float,
+               reserved: int = 0, batch: bool = False):
+        """Record a completed provider call, replacing its reserved estimate with the actual usage"""
+        prompt_price, completion_price = model_price(model)
+        cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+        with self._lock:
+            self._used += prompt_tokens + completion_tokens - reserved
+            stats = self._site(site)
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["cost_usd"] += cost * (BATCH_DISCOUNT if batch else 1)
+            stats["latencies"].append(seconds)
+
+    def record_cached(self, site: str):
+        with self._lock:
+            self._site(site)["cached"] += 1
+
+    def summary(self) -> Dict:
+        with self._lock:
+            sites = {
+                site: {
+                    "calls": s["calls"],
+                    "cached": s["cached"],
+                    "prompt_tokens": s["prompt_tokens"],
+                    "completion_tokens": s["completion_tokens"],
+                    "cost_usd": round(s["cost_usd"], 4),
+                    "latency_p50_ms": round(_percentile(s["latencies"], 0.5) * 1000, 1),
+                    "latency_p95_ms": round(_percentile(s["latencies"], 0.95) * 1000, 1),
+                    "latency_max_ms": round(max(s["latencies"], default=0.0) * 1000, 1)
+                }
+                for site, s in self._sites.items()
+            }
+            return {
+                "sites": sites,
+                "total_tokens": sum(s["prompt_tokens"] + s["completion_tokens"] for s in sites.values()),
+                "total_cost_usd": round(sum(s["cost_usd"] for s in sites.values()), 4),
+                "budget": self.budget
+            }
+
+    def export(self, path: str = LLM_USAGE_REPORT) -> Dict:
+        """Write the summary as JSON (when path is set) and return it"""
+        summary = {"generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **self.summary()}
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
+        return summary
+
+
+_usage = UsageTracker()
+
+
+def get_usage() -> UsageTracker:
+    """Process-wide usage tracker"""
+    return _usage
+
+
+def _response_tokens(usage, prompt: str, content: str, model: str) -> tuple:
+    """(prompt, completion) tokens from the provider's usage, or counted locally when it has none"""
+    if usage is not None:
+        return usage.prompt_tokens, usage.completion_tokens
+    return count_tokens(prompt, model), count_tokens(content, model)
+
+
+def completion_key(model: str, messages: List[Dict], temperature: Optional[float],
+                   max_tokens: Optional[int]) -> str:
+    """Content address of a completion request"""
+    payload = json.dumps([model, messages, temperature, max_tokens], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """In-memory LRU backed by SQLite, with TTL and size-based eviction and hit/miss counters"""
+
+    def __init__(self, ttl: float = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 db_path: Optional[str] = LLM_CACHE_DB, max_disk_entries: int = LLM_CACHE_MAX_DISK_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS completions ("
+                    " key TEXT PRIMARY KEY, content TEXT NOT NULL, stored_at REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS idx_completions_stored_at ON completions (stored_at)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                # Read-only filesystems (e.g. deployed functions) fall back to memory only
+                print(f"⚠️ LLM cache running in memory only ({db_path}: {e})")
+                self._db = None
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._memory.pop(key, None)
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT content, stored_at FROM completions WHERE key=?", (key,)
+                ).fetchone()
+                if row and now - row[1] < self.ttl:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+        return None
+
+    def put(self, key: str, content: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, content, now)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?)", (key, content, now))
+                # Expire old rows, then trim the oldest beyond the size limit
+                self._db.execute("DELETE FROM completions WHERE stored_at < ?", (now - self.ttl,))
+                self._db.execute(
+                    "DELETE FROM completions WHERE key IN ("
+                    " SELECT key FROM completions ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,)
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, content: str, stored_at: float):
+        self._memory[key] = (content, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+_cache: Optional[CompletionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[CompletionCache]:
+    """Process-wide completion cache, or None when LLM_CACHE_TTL is 0"""
+    global _cache
+    if LLM_CACHE_TTL <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CompletionCache()
+    return _cache
+
+
+def _prepare(prompt: str, model: str, temperature: Optional[float], max_tokens: Optional[int]):
+    """Build the cache key and provider parameters for a single-message prompt"""
+    messages = [{"role": "user", "content": prompt}]
+    params = {"model": model, "messages": messages}
+    if temperature is not None:
+        params["temperature"] = temperature
+    if max_tokens is not None:
+        params["max_tokens"] = max_tokens
+    return completion_key(model, messages, temperature, max_tokens), params
+
+
+def lookup(prompt: str, model: str = "gpt-4", temperature: Optional[float] = None,
+           max_tokens: Optional[int] = None) -> Optional[str]:
+    """Return a cached completion for these parameters without calling the provider"""
+    cache = get_cache()
+    if cache is None:
+        return None
+    return cache.get(_prepare(prompt, model, temperature, max_tokens)[0])
+
+
+def store(prompt: str, content: str, model: str = "gpt-4", temperature: Optional[float] = None,
+          max_tokens: Optional[int] = None):
+    """Cache a completion produced outside chat_completion(), e.g. by the Batch API"""
+    cache = get_cache()
+    if cache is not None:
+        cache.put(_prepare(prompt, model, temperature, max_tokens)[0], content)
+
+
+def pack_by_tokens(items: Dict[str, str], max_tokens: int, max_items: int) -> List[Dict[str, str]]:
+    """Group texts, in order, so each group's estimated size stays within max_tokens and max_items
+
+    A text larger than max_tokens on its own gets a group to itself.
+    """
+    groups, current, size = [], {}, 0
+    for key, text in items.items():
+        tokens = count_tokens(text)
+        if current and (size + tokens > max_tokens or len(current) >= max_items):
+            groups.append(current)
+            current, size = {}, 0
+        current[key] = text
+        size += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _cached(key: str, site: str) -> Optional[str]:
+    cache = get_cache()
+    if cache is None:
+        return None
+    cached = cache.get(key)
+    if cached is not None:
+        _usage.record_cached(site)
+    return cached
+
+
+def _store(key: str, content: str):
+    cache = get_cache()
+    if cache is not None:
+        cache.put(key, content)
+
+
+def chat_completion(create: Callable, prompt: str, model: str = "gpt-4",
+                    temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                    site: str = "default", refresh: bool = False) -> str:
+    """Return the completion text for a single-message prompt, from the cache when possible
+
+    create is the provider call, e.g. openai.chat.completions.create (or the legacy
+    openai.ChatCompletion.create); it is only invoked on a cache miss. site names the caller in the
+    usage summary. refresh skips the cache lookup and overwrites the entry with the new completion.
+    """
+    key, params = _prepare(prompt, model, temperature, max_tokens)
+    cached = None if refresh else _cached(key, site)
+    if cached is not None:
+        return cached
+
+    reserved = _usage.reserve(count_tokens(prompt, model) + (max_tokens or 0))
+    rate_limiter.acquire_openai(prompt, max_tokens=max_tokens or 0)
+    started = time.perf_counter()
+    try:
+        response = create(**params)
+    except Exception:
+        _usage.release(reserved)
+        raise
+    content = response.choices[0].message.content.strip()
+    tokens = _response_tokens(getattr(response, "usage", None), prompt, content, model)
+    _usage.record(site, model, *tokens, time.perf_counter() - started, reserved=reserved)
+
+    _store(key, content)
+    return content
+
+
+def stream_chat_completion(create: Callable, prompt: str, model: str = "gpt-4",
+                           temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                           site: str = "default", refresh: bool = False) -> Iterator[str]:
+    """Yield the completion text in pieces as the provider streams it
+
+    A cached completion is yielded as a single piece unless refresh is set. The assembled text is
+    cached once the stream finishes, so an interrupted stream is never stored.
+    """
+    key, params = _prepare(prompt, model, temperature, max_tokens)
+    cached = None if refresh else _cached(key, site)
+    if cached is not None:
+        yield cached
+        return
+
+    reserved = _usage.reserve(count_tokens(prompt, model) + (max_tokens or 0))
+    rate_limiter.acquire_openai(prompt, max_tokens=max_tokens or 0)
+    started = time.perf_counter()
+    parts, usage = [], None
+    try:
+        # The final chunk carries the token usage and no choices
+        for chunk in create(stream=True, stream_options={"include_usage": True}, **params):
+            usage = getattr(chunk, "usage", None) or usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    except BaseException:
+        _usage.release(reserved)
+        raise
+
+    content = "".join(parts).strip()
+    tokens = _response_tokens(usage, prompt, content, model)
+    _usage.record(site, model, *tokens, time.perf_counter() - started, reserved=reserved)
+    _store(key, content)
+
+
+async def achat_completion(acreate: Callable, prompt: str, model: str = "gpt-4",
+                           temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                           site: str = "default", refresh: bool = False) -> str:
+    """Async counterpart of chat_completion(), sharing the same cache and usage tracker"""
+    key, params = _prepare(prompt, model, temperature, max_tokens)
+    cached = None if refresh else _cached(key, site)
+    if cached is not None:
+        return cached
+
+    reserved = _usage.reserve(count_tokens(prompt, model) + (max_tokens or 0))
+    await rate_limiter.acquire_openai_async(prompt, max_tokens=max_tokens or 0)
+    started = time.perf_counter()
+    try:
+        response = await acreate(**params)
+    except Exception:
+        _usage.release(reserved)
+        raise
+    content = response.choices[0].message.content.strip()
+    tokens = _response_tokens(getattr(response, "usage", None), prompt, content, model)
+    _usage.record(site, model, *tokens, time.perf_counter() - started, reserved=reserved)
+
+    _store(key, content)
+    return content
+
+
+def routed_completion(create: Callable, prompt: str, task: str, validate: Callable[[str], bool],
+                      temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                      models: Optional[List[str]] = None, site: Optional[str] = None,
+                      refresh: bool = False) -> str:
+    """Try each model on the task's ladder until one produces output that passes validate
+
+    Every model is its own call site ("<site or task>:<model>"), so the usage summary shows each
+    tier's latency and how often the larger models were needed. The last model's output is returned even
+    when it fails validation. refresh bypasses the completion cache for every model tried.
+    """
+    models = models or models_for(task)
+    for i, model in enumerate(models):
+        content = chat_completion(create, prompt, model=model, temperature=temperature,
+                                  max_tokens=max_tokens, site=f"{site or task}:{model}", refresh=refresh)
+        if i == len(models) - 1 or validate(content):
+            return content
+        print(f"↗️ {task}: {model} output failed validation, escalating to {models[i + 1]}")
+    return content
+
+
+async def arouted_completion(acreate: Callable, prompt: str, task: str, validate: Callable[[str], bool],
+                             temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                             models: Optional[List[str]] = None, site: Optional[str] = None,
+                             refresh: bool = False) -> str:
+    """Async counterpart of routed_completion()"""
+    models = models or models_for(task)
+    for i, model in enumerate(models):
+        content = await achat_completion(acreate, prompt, model=model, temperature=temperature,
+                                         max_tokens=max_tokens, site=f"{site or task}:{model}", refresh=refresh)
+        if i == len(models) - 1 or validate(content):
+            return content
+        print(f"↗️ {task}: {model} output failed validation, escalating to {models[i + 1]}")
+    return content
@@ -1,15 +1,30 @@
-import os, time, base64
-import re
-import requests
-import urllib.parse
+import os, time
+import argparse
+import asyncio
 import json
+import threading
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
-from openai import OpenAI
+from typing import Dict, Iterable, Iterator, List, Optional
+import httpx
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
 
+import airtable_client
+import batch_generation
+import llm_client
+import prompt_templates
+from airtable_cache import AIRTABLE_CACHE_TTL, RecordCache, cache_key
+from bulk_briefs import READ_BATCH_SIZE, record_id_formula
+from email_senders import GMAIL_BATCH_SIZE, DeliveryUnknown
+from kpis import KPI_FIELDS, KPIState, aggregate_kpis, build_kpi_report
+from leads_mirror import LeadsMirror, table_key
+from outbox import GENERATED, OUTBOX_DB, OUTBOX_MAX_AGE_DAYS, SENT, Outbox
+from pipeline import Stage, run_pipeline
+from reply_classifier import (REPLY_MIN_TRAINING_EXAMPLES, ModelTier, RuleTier, TieredReplyClassifier,
+                              calendly_clicked, training_examples)
+from sender_registry import MESSAGE, UNCONFIRMED, SenderRegistry, classify_error
+from write_behind import WriteBehindBuffer
+
 load_dotenv()
 
 # Configuration
@@ -19,68 +34,162 @@ KPIS_BASE_ID = os.getenv("KPIS_BASE_ID", "app5MfJmA49we1vjM")
 LEADS_TABLE = "Imported table"
 KPIS_TABLE = "Imported table"
 CALENDLY_LINK = os.getenv("CALENDLY_LINK", "https://calendly.com/niya/15min")
-EMAIL_PROVIDER = os.getenv("EMAIL_PROVIDER", "gmail").lower()
-SMTP_SERVER = os.getenv("SMTP_SERVER")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
-SMTP_USERNAME = os.getenv("SMTP_USERNAME")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "4"))
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "2"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "20"))
+KPI_INCREMENTAL = os.getenv("KPI_INCREMENTAL", "false").lower() == "true"
+LEADS_SOURCE = os.getenv("LEADS_SOURCE", "airtable").lower()  # "mirror" selects leads from the local SQLite copy
+REPLY_PACK_MAX_TOKENS = int(os.getenv("REPLY_PACK_MAX_TOKENS", "3000"))  # Estimated reply tokens per packed request
+REPLY_PACK_MAX_ITEMS = int(os.getenv("REPLY_PACK_MAX_ITEMS", "20"))
+REPLY_CLASSIFICATION_TOKENS = 120  # Completion budget per reply in a packed request
+MIN_EMAIL_BODY_CHARS = int(os.getenv("MIN_EMAIL_BODY_CHARS", "80"))  # Shorter drafts escalate to a larger model
+COLD_EMAIL_BATCH = os.getenv("COLD_EMAIL_BATCH", "false").lower() == "true"  # Generate cold emails as one Batch API job
 
 # Initialize services
 openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Sending accounts from email_accounts.json, or the single EMAIL_PROVIDER account; connections open on first send
+sender_registry = SenderRegistry.from_config()
 
 # Initialize Airtable with Personal Access Token
 
 class AirtableAPI:
-    def __init__(self, base_id: str, table_name: str, token: str):
+    def __init__(self, base_id: str, table_name: str, token: str, cache: Optional[RecordCache] = None):
         self.base_id = base_id
         self.table_name = table_name
         self.token = token
-        # URL encode the table name to handle spaces
-        import urllib.parse
-        encoded_table_name = urllib.parse.quote(table_name)
-        self.base_url = f"https://api.airtable.com/v0/{base_id}/{encoded_table_name}"
-        self.headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
+        self.cache = cache
+        # All requests go through the shared pooled session in airtable_client
+        self.base_url = airtable_client.table_url(base_id, table_name)
+        self.headers = airtable_client.auth_headers(token)
     
-    def get_all(self, formula: str = None) -> List[Dict]:
-        """Get all records from Airtable"""
-        params = {}
-        if formula:
-            params["filterByFormula"] = formula
-        
-        response = requests.get(self.base_url, headers=self.headers, params=params)
-        response.raise_for_status()
+    def iter_records(self, formula: str = None, fields: Optional[List[str]] = None,
+                     page_size: int = 100) -> Iterator[Dict]:
+        """Yield records page by page, following Airtable's offset cursor"""
+        records = airtable_client.iter_records(self.base_url, self.headers, formula=formula,
+                                               fields=fields, page_size=page_size)
+        if self.cache is None:
+            return records
+        return self._read_through(cache_key(self.base_id, self.table_name, formula, fields), records)
+    
+    def _read_through(self, key, records: Iterator[Dict]) -> Iterator[Dict]:
+        """Serve a query from the cache, or stream it from Airtable and cache the complete result"""
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield from cached
+            return
         
-        data = response.json()
-        return data.get("records", [])
+        collected = []
+        for record in records:
+            if collected is not None:
+                collected.append(record)
+                # Results too large to hold are streamed through without caching
+                if len(collected) > self.cache.max_records:
+                    collected = None
+            yield record
+        if collected is not None:
+            self.cache.put(key, collected)
+    
+    def _written(self, records: List[Dict], created: bool = False):
+        if self.cache is not None:
+            self.cache.record_written(self.base_id, self.table_name, records, created=created)
+    
+    def get_all(self, formula: str = None, fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get all records from Airtable"""
+        return list(self.iter_records(formula=formula, fields=fields))
     
     def update(self, record_id: str, fields: Dict) -> Dict:
         """Update a record in Airtable"""
         url = f"{self.base_url}/{record_id}"
         payload = {"fields": fields}
         
-        response = requests.patch(url, headers=self.headers, json=payload)
+        response = airtable_client.request("PATCH", url, headers=self.headers, json=payload)
         response.raise_for_status()
         
-        return response.json()
+        record = response.json()
+        self._written([record])
+        return record
     
     def create(self, fields: Dict) -> Dict:
         """Create a new record in Airtable"""
         payload = {"fields": fields}
         
-        response = requests.post(self.base_url, headers=self.headers, json=payload)
+        response = airtable_client.request("POST", self.base_url, headers=self.headers, json=payload)
+        response.raise_for_status()
+        
+        record = response.json()
+        self._written([record], created=True)
+        return record
+    
+    def batch_create(self, fields_list: List[Dict], typecast: bool = False) -> List[Dict]:
+        """Create many records, 10 per request"""
+        records = [{"fields": fields} for fields in fields_list]
+        created = airtable_client.batch_write("POST", self.base_url, self.headers, records,
+                                              {"typecast": typecast})
+        self._written(created, created=True)
+        return created
+    
+    def batch_update(self, updates: List[Dict], typecast: bool = False) -> List[Dict]:
+        """Update many records, 10 per request; each update is {"id": ..., "fields": {...}}"""
+        updated = airtable_client.batch_write("PATCH", self.base_url, self.headers, updates,
+                                              {"typecast": typecast})
+        self._written(updated)
+        return updated
+    
+    def batch_upsert(self, fields_list: List[Dict], merge_on: List[str], typecast: bool = False) -> List[Dict]:
+        """Create or update many records, matching existing ones on the merge_on fields"""
+        records = [{"fields": fields} for fields in fields_list]
+        upserted = airtable_client.batch_write("PATCH", self.base_url, self.headers, records, {
+            "performUpsert": {"fieldsToMergeOn": merge_on},
+            "typecast": typecast
+        })
+        if self.cache is not None:
+            # We cannot tell which records were created rather than updated, so start over
+            self.cache.invalidate(self.base_id, self.table_name)
+        return upserted
+
+class AsyncAirtableAPI:
+    """Async counterpart of AirtableAPI used by AsyncNiyaSalesAgent"""
+    
+    def __init__(self, base_id: str, table_name: str, token: str, client: httpx.AsyncClient,
+                 cache: Optional[RecordCache] = None):
+        self.base_id = base_id
+        self.table_name = table_name
+        self.client = client
+        self.cache = cache
+        self.base_url = airtable_client.table_url(base_id, table_name)
+        self.headers = airtable_client.auth_headers(token)
+    
+    async def get_all(self, formula: str = None, fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get all records from Airtable"""
+        return [record async for record in airtable_client.aiter_records(
+            self.client, self.base_url, self.headers, formula=formula, fields=fields)]
+    
+    async def update(self, record_id: str, fields: Dict) -> Dict:
+        """Update a record in Airtable"""
+        url = f"{self.base_url}/{record_id}"
+        response = await airtable_client.arequest(self.client, "PATCH", url, headers=self.headers,
+                                                  json={"fields": fields})
         response.raise_for_status()
         
-        return response.json()
+        record = response.json()
+        # Keep the sync clients' cache consistent with writes made on the event loop
+        if self.cache is not None:
+            self.cache.record_written(self.base_id, self.table_name, [record])
+        return record
 
-# Initialize Airtable connections
-leads_at = AirtableAPI(LEADS_BASE_ID, LEADS_TABLE, AIRTABLE_TOKEN)
-kpis_at = AirtableAPI(KPIS_BASE_ID, KPIS_TABLE, AIRTABLE_TOKEN)
+# Initialize Airtable connections, sharing one read-through cache
+airtable_cache = RecordCache() if AIRTABLE_CACHE_TTL > 0 else None
+leads_at = AirtableAPI(LEADS_BASE_ID, LEADS_TABLE, AIRTABLE_TOKEN, cache=airtable_cache)
+kpis_at = AirtableAPI(KPIS_BASE_ID, KPIS_TABLE, AIRTABLE_TOKEN, cache=airtable_cache)
+LEADS_MIRROR_KEY = table_key(LEADS_BASE_ID, LEADS_TABLE)
 
 class NiyaSalesAgent:
-    def __init__(self):
+    # Generation parameters for cold emails, shared by the per-lead and batch paths
+    COLD_EMAIL_MAX_TOKENS = 300
+    COLD_EMAIL_TEMPERATURE = 0.7
+    COLD_EMAIL_KIND = "cold_email"  # Outbox kind; follow-ups are "follow_up_<n>"
+    
+    def __init__(self, batch_mode: bool = COLD_EMAIL_BATCH):
         self.kpis = {
             "emails_sent": 0,
             "replies_received": 0,
@@ -88,163 +197,317 @@ class NiyaSalesAgent:
             "meetings_booked": 0,
             "calendly_clicks": 0
         }
+        # Pipeline stages run on several threads
+        self._kpis_lock = threading.Lock()
+        self.mirror = LeadsMirror() if LEADS_SOURCE == "mirror" else None
+        self.batch_mode = batch_mode
+        # Generated emails are queued on disk so an interrupted run can finish them without regenerating
+        self.outbox = Outbox(OUTBOX_DB) if OUTBOX_DB else None
+        # Status updates after a send are merged per lead and written 10 at a time off the send path
+        self.lead_writes = WriteBehindBuffer(self._write_lead_updates)
+        # Rules, then the local model if one has been trained, then the LLM for whatever is left
+        local_tiers = [RuleTier()] + [tier for tier in [ModelTier.load()] if tier is not None]
+        self.reply_classifier = TieredReplyClassifier(local_tiers, self.llm_classify_reply,
+                                                      self.llm_classify_replies)
+        # Templates are compiled once; every prompt for a task shares the same static prefix
+        self.cold_email_template = prompt_templates.get("cold_email").bind(calendly_link=CALENDLY_LINK)
+        self.follow_up_template = prompt_templates.get("follow_up").bind(calendly_link=CALENDLY_LINK)
     
-    def fetch_leads(self, status_filter: str = "new") -> List[Dict]:
-        """Fetch leads based on status filter"""
+    def lead_formula(self, status_filter: str) -> Optional[str]:
+        """Airtable filterByFormula for a status filter; None means every lead"""
         if status_filter == "new":
-            formula = "AND({Email Sent?}='FALSE', {Email}!='')"
+            return "AND({Email Sent?}='FALSE', {Email}!='')"
         elif status_filter == "follow_up":
-            formula = "AND({Email Sent?}='TRUE', {Last Email Sent}!='', {Reply Type}='')"
+            return "AND({Email Sent?}='TRUE', {Last Email Sent}!='', {Reply Type}='')"
         elif status_filter == "positive":
-            formula = "{Reply Type}='Interested'"
-        else:
-            formula = ""
+            return "{Reply Type}='Interested'"
+        return None
+    
+    def iter_leads(self, status_filter: str = "new", fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        """Stream leads based on status filter, one Airtable page at a time (or from the local mirror)"""
+        if self.mirror is not None:
+            return self.mirror.iter_records(LEADS_MIRROR_KEY, status_filter, fields=fields)
+        return leads_at.iter_records(formula=self.lead_formula(status_filter), fields=fields)
+    
+    def sync_mirror(self, mirror: Optional[LeadsMirror] = None):
+        """Delta-sync the leads and KPIs tables into the local SQLite mirror"""
+        mirror = mirror or self.mirror or LeadsMirror()
+        for api in (leads_at, kpis_at):
+            synced = mirror.sync(table_key(api.base_id, api.table_name), api)
+            print(f"🔁 Synced {synced} changed records from {api.base_id}/{api.table_name} into {mirror.path}")
+    
+    def fetch_leads(self, status_filter: str = "new", fields: Optional[List[str]] = None) -> List[Dict]:
+        """Fetch leads based on status filter"""
+        return list(self.iter_leads(status_filter, fields=fields))
+    
+    def cold_email_prompt(self, fields: Dict) -> str:
+        """Build the cold email prompt for a lead"""
+        return self.cold_email_template.render(fields)
+    
+    @staticmethod
+    def valid_email(content: str) -> bool:
+        """A usable draft has a subject line followed by a body of reasonable length"""
+        lines = content.strip().split('\n')
+        subject, body = lines[0].strip(), '\n'.join(lines[1:]).strip()
+        return 0 < len(subject) <= 150 and len(body) >= MIN_EMAIL_BODY_CHARS
+    
+    def generate_cold_email(self, fields: Dict, models: Optional[List[str]] = None) -> str:
+        """Generate personalized cold email, escalating to a larger model if the draft is unusable"""
+        prompt = self.cold_email_prompt(fields)
         
-        return leads_at.get_all(formula=formula) if formula else leads_at.get_all()
+        return llm_client.routed_completion(
+            openai.chat.completions.create, prompt, "cold_email", self.valid_email,
+            max_tokens=self.COLD_EMAIL_MAX_TOKENS,
+            temperature=self.COLD_EMAIL_TEMPERATURE,
+            models=models
+        )
     
-    def generate_cold_email(self, fields: Dict) -> str:
-        """Generate personalized cold email using GPT-4"""
-        prompt = f"""
-        Write a compelling 3-4 line personalized outbound email from Niya to {fields.get('Lead Name', 'the prospect')} 
-        who is a {fields.get('Role', 'decision maker')} at {fields.get('Company Name', 'their company')}.
+    def generate_cold_emails_batch(self, leads: List[Dict]) -> Dict[str, str]:
+        """Generate cold emails for many leads as one Batch API job; returns email content by record ID
         
-        Company context: {fields.get('Company Description', '')}
-        Stage: {fields.get('Stage', 'Series B/C')}
+        Prompts already in the LLM cache are not resubmitted, and batch results are written back to
+        the cache so a rerun after a crash does not pay for them again. Leads missing from the result
+        (failed requests) are left for the next run.
+        """
+        # The job runs on the cheapest model; drafts that fail validation escalate individually below
+        ladder = llm_client.models_for("cold_email")
+        params = {"model": ladder[0], "max_tokens": self.COLD_EMAIL_MAX_TOKENS,
+                  "temperature": self.COLD_EMAIL_TEMPERATURE}
+        prompts = {record['id']: self.cold_email_prompt(record['fields']) for record in leads}
         
-        The email should:
-        1. Be personalized and relevant to their role/company
-        2. Mention their company stage if relevant
-        3. Offer a 15-minute discovery call
-        4. Include a Calendly link: {CALENDLY_LINK}
-        5. Be professional but conversational
-        6. End with a clear call-to-action
+        contents = {}
+        for record_id, prompt in prompts.items():
+            cached = llm_client.lookup(prompt, **params)
+            if cached is not None:
+                contents[record_id] = cached
+        pending = {record_id: prompt for record_id, prompt in prompts.items() if record_id not in contents}
+        if not pending:
+            return self._escalate_drafts(leads, contents, ladder)
         
-        Format: Subject line on first line, then email body.
-        """
+        # Not keyed by date, so a job submitted before a crash is resumed whenever the rerun starts
+        input_path = os.path.join(batch_generation.BATCH_DIR, "cold_emails.jsonl")
+        output_path = input_path.replace(".jsonl", "_output.jsonl")
+        # The whole job counts against the token budget before anything is submitted
+        usage = llm_client.get_usage()
+        reserved = usage.reserve(sum(llm_client.count_tokens(prompt) + self.COLD_EMAIL_MAX_TOKENS
+                                     for prompt in pending.values()))
+        # A job already submitted for this file is resumed, so its requests must not be rewritten; leads
+        # that became new since then are not in it and are generated on the next run
+        if not batch_generation.is_pending(input_path):
+            batch_generation.write_batch_file(input_path, pending, **params)
+        print(f"📦 Generating {len(pending)} cold emails in one batch ({len(contents)} from cache)")
         
-        response = openai.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=300,
-            temperature=0.7
-        )
-        return response.choices[0].message.content.strip()
+        if batch_generation.BATCH_BACKEND == "local":
+            runner = batch_generation.LocalBatchRunner(openai.chat.completions.create)
+        else:
+            runner = batch_generation.OpenAIBatchRunner(openai)
+        started = time.perf_counter()
+        try:
+            output_path = runner.run(input_path, output_path)
+        finally:
+            usage.release(reserved)
+        results = batch_generation.read_batch_results(output_path, site="cold_email_batch",
+                                                      seconds=time.perf_counter() - started,
+                                                      discounted=runner.discounted)
+        
+        for record_id, content in results.items():
+            if record_id in pending:
+                llm_client.store(pending[record_id], content, **params)
+                contents[record_id] = content
+        return self._escalate_drafts(leads, contents, ladder)
+    
+    def _escalate_drafts(self, leads: List[Dict], contents: Dict[str, str], ladder: List[str]) -> Dict[str, str]:
+        """Regenerate batch drafts that fail validation with the larger models on the cold email ladder"""
+        if len(ladder) < 2:
+            return contents
+        for record in leads:
+            content = contents.get(record['id'])
+            if content is not None and not self.valid_email(content):
+                print(f"↗️ cold_email: batch draft for {record['id']} failed validation, escalating")
+                contents[record['id']] = self.generate_cold_email(record['fields'], models=ladder[1:])
+        return contents
+    
+    FOLLOW_UP_KINDS = {
+        1: "A friendly 3-day follow-up asking if they had a chance to review the initial email",
+        2: "A 7-day follow-up with additional value proposition or case study",
+        3: "A final 14-day follow-up with a different angle or offer"
+    }
+    
+    def follow_up_email_prompt(self, fields: Dict, attempt: int = 1) -> str:
+        """Build the follow-up prompt for a lead based on attempt number"""
+        return self.follow_up_template.render({**fields, "follow_up_kind": self.FOLLOW_UP_KINDS.get(attempt)})
     
     def generate_follow_up_email(self, fields: Dict, attempt: int = 1) -> str:
         """Generate follow-up email based on attempt number"""
-        follow_up_prompts = {
-            1: "Send a friendly 3-day follow-up asking if they had a chance to review the initial email",
-            2: "Send a 7-day follow-up with additional value proposition or case study",
-            3: "Send a final 14-day follow-up with a different angle or offer"
-        }
-        
-        prompt = f"""
-        Write a {follow_up_prompts.get(attempt, 'follow-up')} email to {fields.get('Lead Name', 'the prospect')} 
-        at {fields.get('Company Name', 'their company')}.
-        
-        Previous context: {fields.get('Notes/Objections', '')}
-        Original email sent: {fields.get('Last Email Sent', '')}
+        prompt = self.follow_up_email_prompt(fields, attempt)
         
-        Include the Calendly link: {CALENDLY_LINK}
-        Keep it professional and respectful.
-        """
-        
-        response = openai.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
+        return llm_client.routed_completion(
+            openai.chat.completions.create, prompt, "follow_up", self.valid_email,
             max_tokens=250,
             temperature=0.6
         )
-        return response.choices[0].message.content.strip()
+    
+    REPLY_CATEGORY_NAMES = ("Interested", "Later", "Not Now", "Wrong Person", "Meeting Booked")
+    
+    def parse_classification(self, content: str) -> Optional[Dict]:
+        """The classification in a model answer, or None if it is not JSON with a known category"""
+        try:
+            classification = json.loads(content[content.index('{'):content.rindex('}') + 1])
+        except ValueError:
+            return None
+        if not isinstance(classification, dict) or classification.get("category") not in self.REPLY_CATEGORY_NAMES:
+            return None
+        return classification
     
     def classify_reply(self, reply_text: str) -> Dict:
-        """Classify email reply using GPT-4"""
-        prompt = f"""
-        Analyze this email reply and classify it into one of these categories:
-        - Interested: Wants to learn more, asks questions, shows genuine interest
-        - Later: Not ready now but might be interested later, asks to follow up
-        - Not Now: Not interested, objections, declines
-        - Wrong Person: Not the right contact, should be someone else
-        - Meeting Booked: Confirms meeting or calendar booking via Calendly
-        
-        Reply: {reply_text}
-        
-        Return JSON format:
-        {{
-            "category": "Interested/Later/Not Now/Wrong Person/Meeting Booked",
-            "confidence": 0.95,
-            "key_points": ["point1", "point2"],
-            "next_action": "suggested next step",
-            "calendly_clicked": true/false
-        }}
+        """Classify an email reply locally when the answer is obvious, otherwise with the LLM"""
+        return self.reply_classifier.classify(reply_text)
+    
+    def classify_replies(self, replies) -> Dict[str, Dict]:
+        """Classify many replies; returns classifications keyed by reply ID
+        
+        replies is a dict of reply ID -> text, or a list of texts whose IDs are their positions ("0", "1", ...).
         """
+        if not isinstance(replies, dict):
+            replies = {str(i): text for i, text in enumerate(replies)}
+        return self.reply_classifier.classify_many(replies)
+    
+    def llm_classify_reply(self, reply_text: str) -> Dict:
+        """Classify email reply with the LLM, escalating to a larger model if the answer does not parse"""
+        prompt = prompt_templates.get("classify_reply").render({"reply": reply_text})
         
-        response = openai.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
+        content = llm_client.routed_completion(
+            openai.chat.completions.create, prompt, "classification",
+            lambda answer: self.parse_classification(answer) is not None,
             max_tokens=200,
-            temperature=0.3
+            temperature=0.3,
+            site="classify_reply"
         )
         
-        try:
-            import json
-            return json.loads(response.choices[0].message.content.strip())
-        except:
+        classification = self.parse_classification(content)
+        if classification is None:
             return {
                 "category": "Neutral",
                 "confidence": 0.5,
                 "key_points": ["Unable to parse classification"],
                 "next_action": "Manual review needed"
             }
+        return classification
+    
+    def llm_classify_replies(self, replies: Dict[str, str]) -> Dict[str, Dict]:
+        """Classify many replies with a few packed LLM requests of up to REPLY_PACK_MAX_TOKENS estimated tokens"""
+        results = {}
+        for group in llm_client.pack_by_tokens(replies, REPLY_PACK_MAX_TOKENS, REPLY_PACK_MAX_ITEMS):
+            results.update(self._classify_packed(group))
+        return results
+    
+    def _parse_packed(self, content: str, group: Dict[str, str]) -> Dict[str, Dict]:
+        """Classifications by reply ID from a packed answer; replies that are missing or invalid are left out"""
+        parsed = {}
+        try:
+            # Tolerate prose or code fences around the array
+            items = json.loads(content[content.index('['):content.rindex(']') + 1])
+        except ValueError:
+            return parsed
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict) or item.get("category") not in self.REPLY_CATEGORY_NAMES:
+                continue
+            reply_id = str(item.get("id"))
+            if reply_id in group:
+                parsed[reply_id] = {k: v for k, v in item.items() if k != "id"}
+        return parsed
+    
+    def _classify_packed(self, group: Dict[str, str]) -> Dict[str, Dict]:
+        """Classify a group of replies in one request
+        
+        Replies missing from the answer are retried; if nothing could be parsed the group is split in
+        half, down to single llm_classify_reply() calls.
+        """
+        if len(group) == 1:
+            (reply_id, reply_text), = group.items()
+            return {reply_id: self.llm_classify_reply(reply_text)}
+        
+        # Replies are embedded as JSON so their contents cannot break out of the list
+        replies_json = json.dumps([{"id": reply_id, "text": llm_client.truncate_to_tokens(text)}
+                                   for reply_id, text in group.items()], ensure_ascii=False)
+        prompt = prompt_templates.get("classify_replies").render({"replies_json": replies_json})
+        
+        content = llm_client.routed_completion(
+            openai.chat.completions.create, prompt, "classification",
+            lambda answer: len(self._parse_packed(answer, group)) == len(group),
+            max_tokens=REPLY_CLASSIFICATION_TOKENS * len(group),
+            temperature=0.3,
+            site="classify_replies"
+        )
+        
+        parsed = self._parse_packed(content, group)
+        missing = {reply_id: text for reply_id, text in group.items() if reply_id not in parsed}
+        if not missing:
+            return parsed
+        if len(missing) < len(group):
+            return {**parsed, **self._classify_packed(missing)}
+        
+        print(f"⚠️ Could not parse packed classification of {len(group)} replies; splitting")
+        ids = list(group)
+        half = len(ids) // 2
+        return {
+            **self._classify_packed({reply_id: group[reply_id] for reply_id in ids[:half]}),
+            **self._classify_packed({reply_id: group[reply_id] for reply_id in ids[half:]})
+        }
     
     def send_email(self, to: str, subject: str, body: str) -> bool:
-        """Send email via Gmail API or SMTP (Zoho)"""
-        if EMAIL_PROVIDER == "gmail":
-            try:
-                msg = f"To: {to}\r\nSubject: {subject}\r\n\r\n{body}"
-                import base64
-                from email.mime.text import MIMEText
-                message = MIMEText(body)
-                message["to"] = to
-                message["subject"] = subject
-                raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
-                message_body = {"raw": raw}
-                GMAIL.users().messages().send(userId="me", body=message_body).execute()
-                return True
-            except Exception as e:
-                print(f"❌ Gmail send failed: {e}")
-                return False
-        else:
-            # SMTP (Zoho or other)
-            try:
-                import smtplib
-                from email.mime.text import MIMEText
-                from email.mime.multipart import MIMEMultipart
-                msg = MIMEMultipart()
-                msg["From"] = SMTP_USERNAME
-                msg["To"] = to
-                msg["Subject"] = subject
-                msg.attach(MIMEText(body, "plain"))
-                with smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT) as server:
-                    server.login(SMTP_USERNAME, SMTP_PASSWORD)
-                    server.sendmail(SMTP_USERNAME, to, msg.as_string())
-                return True
-            except Exception as e:
-                print(f"❌ SMTP send failed: {e}")
-                return False
+        """Send email through the next healthy account, failing over to the others on auth or connection errors
+        
+        Raises DeliveryUnknown when the provider may have accepted the email despite the error.
+        """
+        try:
+            sender_registry.send(to, subject, body)
+            return True
+        except DeliveryUnknown:
+            raise
+        except Exception as e:
+            print(f"❌ Send to {to} failed: {e}")
+            return False
+    
+    def send_gmail_batch(self, items: List[Dict]) -> List[Dict]:
+        """Send generated emails through Gmail API batches, many per HTTP request; returns the items sent
+        
+        A chunk no Gmail account has the quota or health for is sent one email at a time instead, and
+        emails a batch lost to an account failure are retried on the other accounts.
+        """
+        sent = []
+        for start in range(0, len(items), GMAIL_BATCH_SIZE):
+            chunk = items[start:start + GMAIL_BATCH_SIZE]
+            account = sender_registry.batch_account(len(chunk))
+            if account is None:
+                sent.extend(item for item in map(self._send_stage, chunk) if item is not None)
+                continue
+            by_id = {item["record"]['id']: item for item in chunk if self._claim(item)}
+            errors = sender_registry.send_batch(account, {
+                record_id: (item["record"]['fields']['Email'], item["subject"], item["body"])
+                for record_id, item in by_id.items()
+            })
+            for record_id, item in by_id.items():
+                error = errors.get(record_id)
+                if error is None:
+                    sent.append(self._record_send(item))
+                elif classify_error(error) == UNCONFIRMED:
+                    self._send_unconfirmed(item, error)
+                elif classify_error(error) == MESSAGE:
+                    print(f"❌ Gmail send failed for {record_id}: {error}")
+                    self._send_failed(item, str(error))
+                else:
+                    # The account failed before Gmail took the email, so another account can send it
+                    item = self._send_stage(item, claimed=True)
+                    if item is not None:
+                        sent.append(item)
+        return sent
     
     def check_calendly_clicks(self, email: str) -> bool:
         """Check if Calendly link was clicked (simplified version)"""
         # In a real implementation, you'd integrate with Calendly webhooks
-        # For now, we'll simulate this based on reply content
-        return "calendly" in email.lower() or "book" in email.lower()
-    
-    def update_lead_status(self, record_id: str, updates: Dict):
-        """Update lead status in Airtable"""
-        try:
-            leads_at.update(record_id, updates)
-        except Exception as e:
-            print(f"Error updating record {record_id}: {e}")
+        # For now, we'll infer this from the reply content
+        return calendly_clicked(email)
     
     def log_kpis(self, kpis: Dict):
         """Log KPIs to the KPIs base"""
@@ -281,162 +544,541 @@ class NiyaSalesAgent:
         except Exception as e:
             print(f"Error logging KPIs: {e}")
     
+    def _generate_cold_stage(self, record: Dict) -> Optional[Dict]:
+        """Pipeline stage: write the cold email for a new lead"""
+        if self._queued(record['id'], self.COLD_EMAIL_KIND):
+            return None
+        fields = record['fields']
+        print(f"📧 Generating email for {fields.get('Lead Name', 'Unknown')} at {fields.get('Company Name', 'Unknown')}")
+        return self._queue(self._cold_email_item(record, self.generate_cold_email(fields)))
+    
+    def _cold_email_item(self, record: Dict, email_content: str) -> Dict:
+        """Split a generated cold email into subject and body plus the Airtable updates to record"""
+        lines = email_content.split('\n')
+        return {
+            "record": record,
+            "kind": self.COLD_EMAIL_KIND,
+            "subject": lines[0],
+            "body": '\n'.join(lines[1:]),
+            "updates": {
+                "Email Sent?": True,
+                "AI Suggested Next Step": "Awaiting reply; follow up in 3 days",
+                "Follow-up Attempts": 0
+            }
+        }
+    
+    def _generate_follow_up_stage(self, record: Dict) -> Optional[Dict]:
+        """Pipeline stage: write the next follow-up for a lead that is due one"""
+        if self._queued(record['id'], self.follow_up_kind(record)):
+            return None
+        fields = record['fields']
+        attempts = fields.get('Follow-up Attempts', 0)
+        print(f"📧 Generating follow-up #{attempts + 1} for {fields.get('Lead Name', 'Unknown')}")
+        return self._queue(self._follow_up_item(record, self.generate_follow_up_email(fields, attempts + 1)))
+    
+    def _follow_up_item(self, record: Dict, email_content: str) -> Dict:
+        """Split a generated follow-up into subject and body plus the Airtable updates to record"""
+        attempts = record['fields'].get('Follow-up Attempts', 0)
+        lines = email_content.split('\n')
+        return {
+            "record": record,
+            "kind": self.follow_up_kind(record),
+            "subject": f"Re: {lines[0]}",
+            "body": '\n'.join(lines[1:]),
+            "updates": {
+                "Follow-up Attempts": attempts + 1,
+                "AI Suggested Next Step": f"Follow-up #{attempts + 1} sent; monitor for reply"
+            }
+        }
+    
+    def _send_stage(self, item: Dict, claimed: bool = False) -> Optional[Dict]:
+        """Pipeline stage: send the generated email; drops the item if sending fails"""
+        if item.get("sent"):
+            return item  # Sent by an earlier run that stopped before recording it
+        if not claimed and not self._claim(item):
+            return None
+        fields = item["record"]['fields']
+        try:
+            sent = self.send_email(fields['Email'], item["subject"], item["body"])
+        except DeliveryUnknown as e:
+            self._send_unconfirmed(item, e)
+            return None
+        if not sent:
+            self._send_failed(item, "send failed")
+            return None
+        return self._record_send(item)
+    
+    def _record_send(self, item: Dict) -> Dict:
+        """Count a sent email and stamp its Airtable updates"""
+        fields = item["record"]['fields']
+        with self._kpis_lock:
+            self.kpis["emails_sent"] += 1
+        item["updates"]["Last Email Sent"] = datetime.now().date().isoformat()
+        if self.outbox is not None:
+            self.outbox.sent(item["record"]['id'], item["kind"], item["updates"])
+        print(f"✅ Email sent successfully to {fields.get('Email', 'Unknown')}")
+        return item
+    
+    def _write_back_stage(self, item: Dict) -> Dict:
+        """Pipeline stage: queue the send's Airtable updates; the outbox entry is closed once they are saved"""
+        record_id = item["record"]['id']
+        on_written = None
+        if self.outbox is not None:
+            on_written = lambda: self.outbox.recorded(record_id, item["kind"])
+        self.lead_writes.add(record_id, item["updates"], on_written)
+        return item
+    
+    def _write_lead_updates(self, updates: List[Dict]):
+        """Flush target for lead_writes: one batched PATCH, then the same fields into the mirror"""
+        leads_at.batch_update(updates)
+        if self.mirror is not None:
+            for update in updates:
+                self.mirror.apply_update(LEADS_MIRROR_KEY, update["id"], update["fields"])
+    
+    def follow_up_kind(self, record: Dict) -> str:
+        return f"follow_up_{record['fields'].get('Follow-up Attempts', 0) + 1}"
+    
+    def _queued(self, record_id: str, kind: str) -> bool:
+        """Whether an earlier run already generated this email; it is finished from the outbox instead"""
+        return self.outbox is not None and self.outbox.active(record_id, kind)
+    
+    def _queue(self, item: Dict) -> Optional[Dict]:
+        """Store a generated email in the outbox before it is sent; None if it was already queued"""
+        if self.outbox is None:
+            return item
+        fields = item["record"]['fields']
+        if not self.outbox.add(item["record"]['id'], item["kind"], fields['Email'], item["subject"], item["body"],
+                               item["updates"]):
+            return None
+        return item
+    
+    def _claim(self, item: Dict) -> bool:
+        return self.outbox is None or self.outbox.claim(item["record"]['id'], item["kind"])
+    
+    def _send_failed(self, item: Dict, error: str):
+        if self.outbox is not None:
+            self.outbox.send_failed(item["record"]['id'], item["kind"], error)
+    
+    def _send_unconfirmed(self, item: Dict, error: Exception):
+        """The provider may have sent it: never resend, leave it for someone to check"""
+        print(f"⚠️ Send to {item['record']['fields']['Email']} may or may not have gone out ({error}); "
+              f"it will not be retried")
+        if self.outbox is not None:
+            self.outbox.send_unconfirmed(item["record"]['id'], item["kind"], str(error))
+    
+    def _selected_leads(self, status_filter: str, record_ids: List[str]) -> List[Dict]:
+        """Current copies of those of the given leads that the status filter still selects"""
+        if self.mirror is not None:
+            wanted = set(record_ids)
+            return [record for record in self.iter_leads(status_filter) if record['id'] in wanted]
+        records = []
+        for start in range(0, len(record_ids), READ_BATCH_SIZE):
+            chunk = record_ids[start:start + READ_BATCH_SIZE]
+            formula = f"AND({self.lead_formula(status_filter)}, {record_id_formula(chunk)})"
+            # Straight from Airtable: a cached read could still show the lead before it replied
+            records.extend(airtable_client.iter_records(leads_at.base_url, leads_at.headers, formula=formula))
+        return records
+    
+    def _still_wanted(self, entries: List[Dict]) -> List[Dict]:
+        """Expire queued emails whose lead is no longer selected for them, e.g. it replied or was emailed by hand
+        
+        Emails already sent are always kept so they get recorded. If the leads cannot be read, the
+        unsent emails wait in the queue for the next run.
+        """
+        record_ids = list({entry["record_id"] for entry in entries if entry["state"] == GENERATED})
+        if not record_ids:
+            return entries
+        try:
+            # The email each lead is due now: a cold email while new, else its next follow-up if one is due
+            due = {record['id']: self.COLD_EMAIL_KIND for record in self._selected_leads("new", record_ids)}
+            due.update((record['id'], self.follow_up_kind(record))
+                       for record in self._due_follow_ups(self._selected_leads("follow_up", record_ids)))
+        except Exception as e:
+            print(f"⚠️ Could not re-check queued leads, leaving their emails for the next run: {e}")
+            return [entry for entry in entries if entry["state"] != GENERATED]
+        
+        wanted = []
+        for entry in entries:
+            if entry["state"] == GENERATED and due.get(entry["record_id"]) != entry["kind"]:
+                self.outbox.expire(entry["record_id"], entry["kind"], "lead no longer selected")
+                continue
+            wanted.append(entry)
+        if len(wanted) < len(entries):
+            print(f"⌛ Dropped {len(entries) - len(wanted)} queued emails whose leads changed since they were written")
+        return wanted
+    
+    def resume_outbox(self):
+        """Send and record the emails an earlier run generated but did not finish"""
+        if self.outbox is None:
+            return
+        if self.outbox.unconfirmed:
+            print(f"⚠️ {self.outbox.unconfirmed} emails were being sent when the last run stopped; "
+                  f"they are marked unconfirmed in {self.outbox.path} and will not be resent")
+        expired = self.outbox.expire_older_than(OUTBOX_MAX_AGE_DAYS)
+        if expired:
+            print(f"⌛ Dropped {expired} queued emails older than {OUTBOX_MAX_AGE_DAYS:g} days")
+        entries = self._still_wanted(self.outbox.pending())
+        if not entries:
+            return
+        print(f"📮 Resuming {len(entries)} queued emails...")
+        items = [{
+            "record": {"id": entry["record_id"], "fields": {"Email": entry["recipient"]}},
+            "kind": entry["kind"],
+            "subject": entry["subject"],
+            "body": entry["body"],
+            "updates": entry["updates"],
+            "sent": entry["state"] == SENT
+        } for entry in entries]
+        finished = run_pipeline(items, [
+            Stage("send", self._send_stage, SEND_WORKERS),
+            Stage("write-back", self._write_back_stage),
+        ], queue_size=PIPELINE_QUEUE_SIZE)
+        print(f"📮 Finished {finished}/{len(entries)} queued emails")
+    
+    def _run_send_pipeline(self, records: Iterable[Dict], generate_stage) -> int:
+        """Overlap LLM generation, sending and Airtable write-back, each with its own worker limit"""
+        return run_pipeline(records, [
+            Stage("generate", generate_stage, GENERATION_WORKERS),
+            Stage("send", self._send_stage, SEND_WORKERS),
+            Stage("write-back", self._write_back_stage),
+        ], queue_size=PIPELINE_QUEUE_SIZE)
+    
     def process_new_leads(self):
         """Process new leads that haven't been emailed yet"""
         print("🔄 Processing new leads...")
         leads = self.fetch_leads("new")
         
+        if self.batch_mode:
+            # Generation is already done, so the first stage only looks up each lead's result
+            contents = self.generate_cold_emails_batch(
+                [record for record in leads if not self._queued(record['id'], self.COLD_EMAIL_KIND)])
+            if sender_registry.batch_account(1) is not None:
+                # Every email is ready up front, so send them in Gmail API batches and then write back
+                items = [self._queue(self._cold_email_item(record, contents[record['id']]))
+                         for record in leads if record['id'] in contents]
+                sent = run_pipeline(self.send_gmail_batch([item for item in items if item is not None]), [
+                    Stage("write-back", self._write_back_stage)
+                ], queue_size=PIPELINE_QUEUE_SIZE)
+            else:
+                sent = self._run_send_pipeline(
+                    (record for record in leads if record['id'] in contents),
+                    lambda record: self._queue(self._cold_email_item(record, contents[record['id']]))
+                )
+        else:
+            sent = self._run_send_pipeline(leads, self._generate_cold_stage)
+        print(f"📨 Sent {sent}/{len(leads)} new lead emails")
+    
+    def _due_follow_ups(self, leads: List[Dict]) -> Iterator[Dict]:
+        """Yield the leads whose next follow-up is due"""
+        follow_up_schedule = [3, 7, 14]  # Days after last email
         for record in leads:
             fields = record['fields']
-            print(f"📧 Sending email to {fields.get('Lead Name', 'Unknown')} at {fields.get('Company Name', 'Unknown')}")
-            
-            # Generate and send email
-            email_content = self.generate_cold_email(fields)
-            lines = email_content.split('\n')
-            subject = lines[0]
-            body = '\n'.join(lines[1:])
+            last_sent = datetime.fromisoformat(fields.get('Last Email Sent', '2024-01-01'))
+            days_since = (datetime.now().date() - last_sent.date()).days
+            attempts = fields.get('Follow-up Attempts', 0)
             
-            if self.send_email(fields['Email'], subject, body):
-                self.kpis["emails_sent"] += 1
-                
-                # Update Airtable
-                self.update_lead_status(record['id'], {
-                    "Email Sent?": True,
-                    "Last Email Sent": datetime.now().date().isoformat(),
-                    "AI Suggested Next Step": "Awaiting reply; follow up in 3 days",
-                    "Follow-up Attempts": 0
-                })
-                
-                print(f"✅ Email sent successfully to {fields.get('Email', 'Unknown')}")
-                time.sleep(2)  # Rate limiting
+            if days_since >= follow_up_schedule[min(attempts, len(follow_up_schedule) - 1)]:
+                yield record
     
     def process_follow_ups(self):
         """Process leads that need follow-up emails"""
         print("🔄 Processing follow-ups...")
         leads = self.fetch_leads("follow_up")
         
-        for record in leads:
-            fields = record['fields']
-            last_sent = datetime.fromisoformat(fields.get('Last Email Sent', '2024-01-01'))
-            days_since = (datetime.now().date() - last_sent.date()).days
-            attempts = fields.get('Follow-up Attempts', 0)
-            
-            # Determine if follow-up is due
-            follow_up_schedule = [3, 7, 14]  # Days after last email
-            if days_since >= follow_up_schedule[min(attempts, len(follow_up_schedule) - 1)]:
-                print(f"📧 Sending follow-up #{attempts + 1} to {fields.get('Lead Name', 'Unknown')}")
-                
-                email_content = self.generate_follow_up_email(fields, attempts + 1)
-                lines = email_content.split('\n')
-                subject = f"Re: {lines[0]}"
-                body = '\n'.join(lines[1:])
-                
-                if self.send_email(fields['Email'], subject, body):
-                    self.kpis["emails_sent"] += 1
-                    
-                    # Update Airtable
-                    self.update_lead_status(record['id'], {
-                        "Last Email Sent": datetime.now().date().isoformat(),
-                        "Follow-up Attempts": attempts + 1,
-                        "AI Suggested Next Step": f"Follow-up #{attempts + 1} sent; monitor for reply"
-                    })
-                    
-                    print(f"✅ Follow-up sent successfully")
-                    time.sleep(2)
+        sent = self._run_send_pipeline(self._due_follow_ups(leads), self._generate_follow_up_stage)
+        print(f"📨 Sent {sent} follow-up emails")
     
     def calculate_kpis(self) -> Dict:
         """Calculate and return comprehensive KPIs"""
-        all_leads = self.fetch_leads()
-        
-        total_leads = len(all_leads)
-        emails_sent = sum(1 for lead in all_leads if lead['fields'].get('Email Sent?', False))
+        if KPI_INCREMENTAL:
+            # Only leads modified since the last run are downloaded and applied as deltas
+            counts = KPIState().refresh(
+                lambda formula: leads_at.iter_records(formula=formula, fields=KPI_FIELDS))
+        else:
+            # Stream only the KPI columns and count everything in a single pass
+            counts = aggregate_kpis(self.iter_leads("all", fields=KPI_FIELDS))
+        return build_kpi_report(counts)
+    
+    def report_kpis(self):
+        """Calculate KPIs, print the dashboard and log them to the KPIs base"""
+        kpis = self.calculate_kpis()
+        print("\n📊 Niya Sales Agent KPI Dashboard")
+        print("=" * 50)
+        print(f"📈 Overall Metrics:")
+        print(f"   Total Leads: {kpis['total_leads']}")
+        print(f"   Emails Sent: {kpis['emails_sent']}")
+        print(f"   Reply Rate: {kpis['overall_rates']['reply_rate']:.1f}%")
+        print(f"   Meeting Rate: {kpis['overall_rates']['meeting_rate']:.1f}%")
+        print(f"   Demo Rate: {kpis['overall_rates']['demo_rate']:.1f}%")
         
-        # Reply classification counts
-        interested_count = sum(1 for lead in all_leads if lead['fields'].get('Reply Status') == 'Interested')
-        later_count = sum(1 for lead in all_leads if lead['fields'].get('Reply Status') == 'Later')
-        not_now_count = sum(1 for lead in all_leads if lead['fields'].get('Reply Status') == 'Not Now')
-        wrong_person_count = sum(1 for lead in all_leads if lead['fields'].get('Reply Status') == 'Wrong Person')
-        meeting_booked_count = sum(1 for lead in all_leads if lead['fields'].get('Reply Status') == 'Meeting Booked')
+        print(f"\n📧 Reply Breakdown:")
+        print(f"   Interested: {kpis['reply_breakdown']['interested']}")
+        print(f"   Later: {kpis['reply_breakdown']['later']}")
+        print(f"   Not Now: {kpis['reply_breakdown']['not_now']}")
+        print(f"   Wrong Person: {kpis['reply_breakdown']['wrong_person']}")
+        print(f"   Meeting Booked: {kpis['reply_breakdown']['meeting_booked']}")
         
-        # Calendly tracking
-        calendly_clicks = sum(1 for lead in all_leads if lead['fields'].get('Calendly Clicked', False))
-        demos_booked = sum(1 for lead in all_leads if lead['fields'].get('Demo Booked?', False))
+        print(f"\n📅 Calendly Metrics:")
+        print(f"   Clicks: {kpis['calendly_metrics']['clicks']}")
+        print(f"   Demos Booked: {kpis['calendly_metrics']['demos_booked']}")
+        print(f"   Conversion Rate: {kpis['calendly_metrics']['conversion_rate']:.1f}%")
         
-        # Follow-up metrics
-        follow_up_attempts = sum(lead['fields'].get('Follow-up Attempts', 0) for lead in all_leads)
+        print(f"\n🔄 Follow-up Metrics:")
+        print(f"   Total Attempts: {kpis['follow_up_metrics']['total_attempts']}")
+        print(f"   Avg Attempts/Lead: {kpis['follow_up_metrics']['avg_attempts_per_lead']:.1f}")
         
-        return {
-            "total_leads": total_leads,
-            "emails_sent": emails_sent,
-            "reply_breakdown": {
-                "interested": interested_count,
-                "later": later_count,
-                "not_now": not_now_count,
-                "wrong_person": wrong_person_count,
-                "meeting_booked": meeting_booked_count
-            },
-            "calendly_metrics": {
-                "clicks": calendly_clicks,
-                "demos_booked": demos_booked,
-                "conversion_rate": (demos_booked / calendly_clicks * 100) if calendly_clicks > 0 else 0
-            },
-            "follow_up_metrics": {
-                "total_attempts": follow_up_attempts,
-                "avg_attempts_per_lead": follow_up_attempts / emails_sent if emails_sent > 0 else 0
-            },
-            "overall_rates": {
-                "reply_rate": ((interested_count + later_count + meeting_booked_count) / emails_sent * 100) if emails_sent > 0 else 0,
-                "meeting_rate": (meeting_booked_count / emails_sent * 100) if emails_sent > 0 else 0,
-                "demo_rate": (demos_booked / emails_sent * 100) if emails_sent > 0 else 0
-            }
-        }
+        # Log KPIs to the KPIs base
+        self.log_kpis(kpis)
+    
+    def train_reply_model(self):
+        """Train the local reply model on leads whose replies have already been classified"""
+        texts, labels = training_examples(leads_at.iter_records(formula="{Reply Type}!=''"))
+        if len(texts) < REPLY_MIN_TRAINING_EXAMPLES or len(set(labels)) < 2:
+            print(f"⚠️ Not enough labelled replies to train on ({len(texts)} found)")
+            return
+        ModelTier.train(texts, labels)
+        print(f"🧠 Trained reply model on {len(texts)} labelled replies")
+    
+    def report_senders(self):
+        """Print each sending account's sends today against its quota and its health"""
+        for name, stats in sender_registry.stats().items():
+            quota = f"/{stats['daily_quota']}" if stats['daily_quota'] is not None else ""
+            transport = stats['transport']
+            print(f"📮 {name}: {stats['sent_today']}{quota} sent today, health {stats['health']:.2f}"
+                  + (" (resting after failures)" if stats['resting'] else ""))
+            if "connections" in transport:
+                print(f"   SMTP pool: {transport['messages']} messages over {transport['connections']} connections, "
+                      f"{transport['reconnects']} reconnects")
+    
+    def report_lead_writes(self):
+        """Print how many status updates the write-behind buffer merged into how many PATCH requests"""
+        stats = self.lead_writes.stats()
+        if stats["updates"]:
+            failed = f", {stats['failed']} given up on" if stats['failed'] else ""
+            print(f"📝 Lead updates: {stats['updates']} merged into {stats['records']} records "
+                  f"over {stats['requests']} requests{failed}")
+    
+    def report_outbox(self):
+        """Print how many outbox emails are in each state"""
+        if self.outbox is None:
+            return
+        counts = self.outbox.counts()
+        if counts:
+            print("📮 Outbox: " + ", ".join(f"{count} {state}" for state, count in sorted(counts.items())))
+    
+    def report_reply_classifier(self):
+        """Print how many replies each classification tier answered and how long it took"""
+        for tier, stats in self.reply_classifier.stats().items():
+            if stats["seen"]:
+                print(f"🏷️ {tier}: answered {stats['answered']}/{stats['seen']} replies "
+                      f"({stats['hit_rate'] * 100:.0f}%), {stats['avg_ms']:.1f} ms avg")
+    
+    def report_llm_usage(self):
+        """Print tokens, cost and latency per LLM call site and export them as JSON"""
+        summary = llm_client.get_usage().export()
+        if not summary["sites"]:
+            return
+        print("\n💰 LLM usage:")
+        for site, stats in summary["sites"].items():
+            print(f"   {site}: {stats['calls']} calls ({stats['cached']} cached), "
+                  f"{stats['prompt_tokens']}+{stats['completion_tokens']} tokens, ${stats['cost_usd']:.4f}, "
+                  f"p50 {stats['latency_p50_ms']:.0f} ms / p95 {stats['latency_p95_ms']:.0f} ms")
+        print(f"   Total: {summary['total_tokens']} tokens, ${summary['total_cost_usd']:.4f}"
+              + (f" of a {summary['budget']} token budget" if summary['budget'] else ""))
+    
+    def report_llm_cache(self):
+        """Print how many completions were served from the LLM cache this run"""
+        cache = llm_client.get_cache()
+        if cache is not None:
+            stats = cache.stats()
+            print(f"\n🧠 LLM cache: {stats['hits']} hits, {stats['misses']} misses "
+                  f"({stats['hit_rate'] * 100:.0f}% hit rate)")
     
     def run(self):
         """Main execution loop"""
         print("🚀 Starting Niya Sales Agent...")
         
         try:
+            # Lead selection reads the mirror, so bring it up to date first
+            if self.mirror is not None:
+                self.sync_mirror()
+            
+            # Finish what an interrupted run left in the outbox before generating anything new
+            self.resume_outbox()
+            
             # Process new leads
             self.process_new_leads()
             
             # Process follow-ups
             self.process_follow_ups()
             
-            # Calculate and display KPIs
-            kpis = self.calculate_kpis()
-            print("\n📊 Niya Sales Agent KPI Dashboard")
-            print("=" * 50)
-            print(f"📈 Overall Metrics:")
-            print(f"   Total Leads: {kpis['total_leads']}")
-            print(f"   Emails Sent: {kpis['emails_sent']}")
-            print(f"   Reply Rate: {kpis['overall_rates']['reply_rate']:.1f}%")
-            print(f"   Meeting Rate: {kpis['overall_rates']['meeting_rate']:.1f}%")
-            print(f"   Demo Rate: {kpis['overall_rates']['demo_rate']:.1f}%")
+            # KPIs are read back from Airtable, so the buffered status updates must land first
+            self.lead_writes.flush()
+            
+            # Calculate, display and log KPIs
+            self.report_kpis()
+            
+            self.report_llm_cache()
+            self.report_reply_classifier()
+            self.report_senders()
+            self.report_outbox()
+            
+        except Exception as e:
+            print(f"❌ Error in main execution: {e}")
+        finally:
+            # Spend is worth seeing even when the run failed part-way
+            self.report_llm_usage()
+            self.lead_writes.close()
+            self.report_lead_writes()
+            sender_registry.close()
+
+class AsyncNiyaSalesAgent(NiyaSalesAgent):
+    """Runs new-lead and follow-up processing concurrently on one event loop
+    
+    OpenAI calls and Airtable reads are awaited directly; the blocking email senders run in the
+    default thread pool. Each kind of I/O is bounded by its own semaphore, and status updates go
+    through the same write-behind buffer as the threaded agent.
+    """
+    
+    def __init__(self):
+        # The async loop sends each lead as soon as its email is written; it has no batch mode
+        super().__init__(batch_mode=False)
+        self.aopenai = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    
+    async def agenerate(self, prompt: str, max_tokens: int, temperature: float, task: str) -> str:
+        """Generate an email with the async OpenAI client, escalating models on an unusable draft"""
+        return await llm_client.arouted_completion(
+            self.aopenai.chat.completions.create, prompt, task, self.valid_email,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+    
+    async def _process_lead(self, record: Dict, prompt: str, max_tokens: int, temperature: float, build_item,
+                            task: str, kind: str):
+        """Generate, send and record one email, holding each semaphore only for its own step"""
+        fields = record['fields']
+        if self._queued(record['id'], kind):
+            return
+        try:
+            async with self._llm_slots:
+                email_content = await self.agenerate(prompt, max_tokens, temperature, task)
+            item = self._queue(build_item(record, email_content))
+            if item is None or not self._claim(item):
+                return
+            
+            loop = asyncio.get_running_loop()
+            async with self._send_slots:
+                try:
+                    sent = await loop.run_in_executor(None, self.send_email, fields['Email'],
+                                                      item["subject"], item["body"])
+                except DeliveryUnknown as e:
+                    self._send_unconfirmed(item, e)
+                    return
+            if not sent:
+                self._send_failed(item, "send failed")
+                return
+            self._write_back_stage(self._record_send(item))
+        except Exception as e:
+            print(f"❌ Error processing {fields.get('Email', record['id'])}: {e}")
+    
+    async def afetch_leads(self, status_filter: str) -> List[Dict]:
+        """Fetch leads based on status filter, from the local mirror when LEADS_SOURCE=mirror"""
+        if self.mirror is not None:
+            # A local SQLite query; not worth a trip through the thread pool
+            return self.fetch_leads(status_filter)
+        return await self.leads.get_all(formula=self.lead_formula(status_filter))
+    
+    async def process_new_leads(self):
+        """Process new leads that haven't been emailed yet"""
+        print("🔄 Processing new leads...")
+        leads = await self.afetch_leads("new")
+        
+        await asyncio.gather(*(
+            self._process_lead(record, self.cold_email_prompt(record['fields']), self.COLD_EMAIL_MAX_TOKENS,
+                               self.COLD_EMAIL_TEMPERATURE, self._cold_email_item, task="cold_email",
+                               kind=self.COLD_EMAIL_KIND)
+            for record in leads
+        ))
+    
+    async def process_follow_ups(self):
+        """Process leads that need follow-up emails"""
+        print("🔄 Processing follow-ups...")
+        leads = await self.afetch_leads("follow_up")
+        
+        await asyncio.gather(*(
+            self._process_lead(
+                record,
+                self.follow_up_email_prompt(record['fields'], record['fields'].get('Follow-up Attempts', 0) + 1),
+                250, 0.6, self._follow_up_item, task="follow_up", kind=self.follow_up_kind(record)
+            )
+            for record in self._due_follow_ups(leads)
+        ))
+    
+    async def run_async(self):
+        """Main execution loop"""
+        print("🚀 Starting Niya Sales Agent (async)...")
+        
+        # Semaphores and the HTTP client must be created inside the running loop
+        self._llm_slots = asyncio.Semaphore(GENERATION_WORKERS)
+        self._send_slots = asyncio.Semaphore(SEND_WORKERS)
+        
+        try:
+            # Lead selection reads the mirror, so bring it up to date first
+            if self.mirror is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self.sync_mirror)
             
-            print(f"\n📧 Reply Breakdown:")
-            print(f"   Interested: {kpis['reply_breakdown']['interested']}")
-            print(f"   Later: {kpis['reply_breakdown']['later']}")
-            print(f"   Not Now: {kpis['reply_breakdown']['not_now']}")
-            print(f"   Wrong Person: {kpis['reply_breakdown']['wrong_person']}")
-            print(f"   Meeting Booked: {kpis['reply_breakdown']['meeting_booked']}")
+            # The outbox is finished with the blocking pipeline before any new emails are generated
+            await asyncio.get_running_loop().run_in_executor(None, self.resume_outbox)
             
-            print(f"\n📅 Calendly Metrics:")
-            print(f"   Clicks: {kpis['calendly_metrics']['clicks']}")
-            print(f"   Demos Booked: {kpis['calendly_metrics']['demos_booked']}")
-            print(f"   Conversion Rate: {kpis['calendly_metrics']['conversion_rate']:.1f}%")
+            async with airtable_client.build_async_client() as client:
+                self.leads = AsyncAirtableAPI(LEADS_BASE_ID, LEADS_TABLE, AIRTABLE_TOKEN, client,
+                                              cache=airtable_cache)
+                await asyncio.gather(self.process_new_leads(), self.process_follow_ups())
             
-            print(f"\n🔄 Follow-up Metrics:")
-            print(f"   Total Attempts: {kpis['follow_up_metrics']['total_attempts']}")
-            print(f"   Avg Attempts/Lead: {kpis['follow_up_metrics']['avg_attempts_per_lead']:.1f}")
+            # KPIs are read back from Airtable, so the buffered status updates must land first
+            await asyncio.get_running_loop().run_in_executor(None, self.lead_writes.flush)
             
-            # Log KPIs to the KPIs base
-            self.log_kpis(kpis)
+            # KPI reporting is a handful of requests; keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self.report_kpis)
+            self.report_llm_cache()
+            self.report_reply_classifier()
+            self.report_senders()
+            self.report_outbox()
             
         except Exception as e:
             print(f"❌ Error in main execution: {e}")
+        finally:
+            # Spend is worth seeing even when the run failed part-way
+            self.report_llm_usage()
+            self.lead_writes.close()
+            self.report_lead_writes()
+            sender_registry.close()
+    
+    def run(self):
+        asyncio.run(self.run_async())
 
 def main():
-    agent = NiyaSalesAgent()
+    parser = argparse.ArgumentParser(description="Niya Sales Agent")
+    parser.add_argument("command", nargs="?", choices=["run", "sync", "train-replies"], default="run",
+                        help="run the agent (default), sync the local SQLite mirror, or train the local reply model")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="process new leads and follow-ups concurrently on an asyncio event loop")
+    parser.add_argument("--batch", action="store_true",
+                        help="generate cold emails for all new leads as one OpenAI Batch API job")
+    args = parser.parse_args()
+    
+    if args.command == "sync":
+        NiyaSalesAgent().sync_mirror()
+        return
+    if args.command == "train-replies":
+        NiyaSalesAgent().train_reply_model()
+        return
+    
+    if args.use_async and args.batch:
+        parser.error("--batch is not supported with --async")
+    if args.use_async and COLD_EMAIL_BATCH:
+        parser.error("COLD_EMAIL_BATCH=true is not supported with --async; unset it or run without --async")
+    agent = AsyncNiyaSalesAgent() if args.use_async else NiyaSalesAgent(batch_mode=args.batch or COLD_EMAIL_BATCH)
     agent.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,173 @@
+"""
+Durable outbound email queue
+Each generated email is stored before it is sent and moves generated -> sending -> sent -> recorded, so a
+run that stops part-way resumes without calling OpenAI again or sending the same email twice.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OUTBOX_DB = os.getenv("OUTBOX_DB", "niya_outbox.db")  # Empty disables the outbox
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "3"))  # Failed sends retried on later runs up to this
+OUTBOX_MAX_AGE_DAYS = float(os.getenv("OUTBOX_MAX_AGE_DAYS", "3"))  # Unsent emails older than this are not sent
+
+GENERATED = "generated"
+SENDING = "sending"
+SENT = "sent"
+RECORDED = "recorded"
+FAILED = "failed"  # Gave up after OUTBOX_MAX_ATTEMPTS failed sends
+UNCONFIRMED = "unconfirmed"  # The run stopped mid-send; never retried automatically so it cannot go out twice
+EXPIRED = "expired"  # Never sent: too old, or the lead changed (e.g. replied) before it went out
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    record_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    updates TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at TEXT NOT NULL,
+    created_at TEXT,
+    PRIMARY KEY (record_id, kind)
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox (state);
+"""
+
+COLUMNS = ("record_id", "kind", "recipient", "subject", "body", "updates", "state", "attempts", "error", "created_at")
+
+
+class Outbox:
+    """SQLite queue of emails keyed by (lead record ID, kind), e.g. ("rec123", "follow_up_2")
+
+    Every state change is committed before the caller moves on, so the table always says how far
+    each email got.
+    """
+
+    def __init__(self, path: str = OUTBOX_DB):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._migrate()
+        self._lock = threading.Lock()
+        # Whatever was mid-send when the last run stopped may or may not have gone out
+        self.unconfirmed = self._update("UPDATE outbox SET state=? WHERE state=?", (UNCONFIRMED, SENDING))
+
+    def _migrate(self):
+        """Outboxes created before entries had an age take their last update as their creation time"""
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(outbox)")}
+        if "created_at" not in columns:
+            self._db.execute("ALTER TABLE outbox ADD COLUMN created_at TEXT")
+        self._db.execute("UPDATE outbox SET created_at=updated_at WHERE created_at IS NULL")
+        self._db.commit()
+
+    def _update(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            changed = self._db.execute(sql, params).rowcount
+            self._db.commit()
+        return changed
+
+    def _entry(self, row: tuple) -> Dict:
+        entry = dict(zip(COLUMNS, row))
+        entry["updates"] = json.loads(entry["updates"])
+        return entry
+
+    def get(self, record_id: str, kind: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM outbox WHERE record_id=? AND kind=?", (record_id, kind)
+            ).fetchone()
+        return self._entry(row) if row else None
+
+    def add(self, record_id: str, kind: str, recipient: str, subject: str, body: str, updates: Dict) -> bool:
+        """Queue a generated email; False if this lead already has one of this kind that has not expired"""
+        now = datetime.now().isoformat()
+        return self._update(
+            "INSERT INTO outbox (record_id, kind, recipient, subject, body, updates, state, updated_at, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (record_id, kind) DO UPDATE SET recipient=excluded.recipient, subject=excluded.subject,"
+            " body=excluded.body, updates=excluded.updates, state=excluded.state, attempts=0, error=NULL,"
+            " updated_at=excluded.updated_at, created_at=excluded.created_at WHERE outbox.state=?",
+            (record_id, kind, recipient, subject, body, json.dumps(updates), GENERATED, now, now, EXPIRED)
+        ) == 1
+
+    def active(self, record_id: str, kind: str) -> bool:
+        """Whether this email has been queued and not expired, so it must not be generated again"""
+        entry = self.get(record_id, kind)
+        return entry is not None and entry["state"] != EXPIRED
+
+    def claim(self, record_id: str, kind: str) -> bool:
+        """Move a queued email to sending; False if another worker or an earlier run already took it"""
+        return self._update(
+            "UPDATE outbox SET state=?, updated_at=? WHERE record_id=? AND kind=? AND state=?",
+            (SENDING, datetime.now().isoformat(), record_id, kind, GENERATED)
+        ) == 1
+
+    def sent(self, record_id: str, kind: str, updates: Dict):
+        """The provider accepted the email; updates are the Airtable fields still to be written"""
+        self._update(
+            "UPDATE outbox SET state=?, updates=?, error=NULL, updated_at=? WHERE record_id=? AND kind=?",
+            (SENT, json.dumps(updates), datetime.now().isoformat(), record_id, kind)
+        )
+
+    def send_failed(self, record_id: str, kind: str, error: str):
+        """Put the email back in the queue, or give up once it has failed OUTBOX_MAX_ATTEMPTS times"""
+        self._update(
+            "UPDATE outbox SET attempts=attempts+1, error=?, updated_at=?,"
+            " state=CASE WHEN attempts+1 >= ? THEN ? ELSE ? END WHERE record_id=? AND kind=?",
+            (error, datetime.now().isoformat(), OUTBOX_MAX_ATTEMPTS, FAILED, GENERATED, record_id, kind)
+        )
+
+    def expire(self, record_id: str, kind: str, reason: str) -> bool:
+        """Drop a queued email that has not been sent; False if it is no longer waiting to be sent"""
+        return self._update(
+            "UPDATE outbox SET state=?, error=?, updated_at=? WHERE record_id=? AND kind=? AND state=?",
+            (EXPIRED, reason, datetime.now().isoformat(), record_id, kind, GENERATED)
+        ) == 1
+
+    def expire_older_than(self, days: float = OUTBOX_MAX_AGE_DAYS) -> int:
+        """Expire unsent emails generated more than days ago; returns how many"""
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+        return self._update(
+            "UPDATE outbox SET state=?, error=?, updated_at=? WHERE state=? AND created_at < ?",
+            (EXPIRED, f"older than {days:g} days", datetime.now().isoformat(), GENERATED, cutoff)
+        )
+
+    def send_unconfirmed(self, record_id: str, kind: str, error: str):
+        """The send broke off after the provider took the email; like a crash mid-send, never retried"""
+        self._update(
+            "UPDATE outbox SET state=?, error=?, updated_at=? WHERE record_id=? AND kind=?",
+            (UNCONFIRMED, error, datetime.now().isoformat(), record_id, kind)
+        )
+
+    def recorded(self, record_id: str, kind: str):
+        """The send is written back to Airtable; nothing is left to do for this email"""
+        self._update(
+            "UPDATE outbox SET state=?, updated_at=? WHERE record_id=? AND kind=?",
+            (RECORDED, datetime.now().isoformat(), record_id, kind)
+        )
+
+    def pending(self) -> List[Dict]:
+        """Emails still to send or to record, oldest first"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM outbox WHERE state IN (?, ?) ORDER BY updated_at",
+                (GENERATED, SENT)
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Entries per state"""
+        with self._lock:
+            return dict(self._db.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall())
@@ -0,0 +1,69 @@
+"""
+Bounded producer/consumer pipeline
+Each stage runs in its own thread pool and hands items to the next stage through a bounded queue,
+so a slow stage applies backpressure instead of letting work pile up in memory
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Iterable, List, NamedTuple, Optional
+
+_DONE = object()  # Sentinel telling a worker its input is exhausted
+
+
+class Stage(NamedTuple):
+    name: str
+    func: Callable[[Any], Optional[Any]]  # Returns the item for the next stage, or None to drop it
+    workers: int = 1
+
+
+def run_pipeline(items: Iterable, stages: List[Stage], queue_size: int = 20) -> int:
+    """Push items through the stages concurrently; returns how many items completed every stage"""
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    completed = [0]
+    completed_lock = threading.Lock()
+
+    def worker(index: int):
+        stage = stages[index]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                print(f"❌ {stage.name} stage failed: {e}")
+                continue
+            if result is None:
+                continue
+            if outbox is not None:
+                outbox.put(result)  # Blocks while the next stage is saturated
+            else:
+                with completed_lock:
+                    completed[0] += 1
+
+    pools = []
+    for index, stage in enumerate(stages):
+        threads = [
+            threading.Thread(target=worker, args=(index,), name=f"{stage.name}-{n}", daemon=True)
+            for n in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        pools.append(threads)
+
+    try:
+        for item in items:
+            queues[0].put(item)
+    finally:
+        # Even if items raised, shut stages down in order so each one drains before the next is
+        # told to stop, and nothing is still sending when the caller moves on
+        for index, threads in enumerate(pools):
+            for _ in threads:
+                queues[index].put(_DONE)
+            for thread in threads:
+                thread.join()
+
+    return completed[0]
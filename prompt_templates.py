@@ -0,0 +1,158 @@
+"""
+Versioned prompt templates
+Each template is a static instruction block followed by the per-lead fields, so every prompt for a task
+shares the same prefix and can be served from the provider's prompt cache. Templates are compiled once;
+rendering only joins precomputed pieces with the lead's values.
+"""
+
+from textwrap import dedent
+from typing import Dict, List, Optional, Tuple
+
+import llm_client
+
+# (label, key in the values dict, default when missing or empty, cut to LLM_FIELD_MAX_TOKENS)
+Field = Tuple[str, str, str, bool]
+
+
+class PromptTemplate:
+    """Static instructions first, then one "Label: value" line per field"""
+
+    def __init__(self, name: str, version: int, instructions: str, fields: List[Field]):
+        self.name = name
+        self.version = version
+        self.instructions = dedent(instructions).strip()
+        self.fields = fields
+        self._prefix = self.instructions + "\n\n"
+        self._lines = [(f"{label}: ", key, default, truncate) for label, key, default, truncate in fields]
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def bind(self, **static) -> "PromptTemplate":
+        """Fill deployment-wide placeholders (e.g. {calendly_link}) in the instructions once, up front"""
+        return PromptTemplate(self.name, self.version, self.instructions.format(**static), self.fields)
+
+    def render(self, values: Dict) -> str:
+        parts = [self._prefix]
+        for label, key, default, truncate in self._lines:
+            value = values.get(key) or default
+            if truncate:
+                value = llm_client.truncate_to_tokens(str(value))
+            parts.append(label)
+            parts.append(str(value))
+            parts.append("\n")
+        return "".join(parts)
+
+
+_registry: Dict[str, Dict[int, PromptTemplate]] = {}
+
+
+def register(template: PromptTemplate) -> PromptTemplate:
+    _registry.setdefault(template.name, {})[template.version] = template
+    return template
+
+
+def get(name: str, version: Optional[int] = None) -> PromptTemplate:
+    """A template by name, at the given version or the latest one"""
+    versions = _registry[name]
+    return versions[version if version is not None else max(versions)]
+
+
+REPLY_CATEGORIES = """
+- Interested: Wants to learn more, asks questions, shows genuine interest
+- Later: Not ready now but might be interested later, asks to follow up
+- Not Now: Not interested, objections, declines
+- Wrong Person: Not the right contact, should be someone else
+- Meeting Booked: Confirms meeting or calendar booking via Calendly
+""".strip()
+
+register(PromptTemplate("cold_email", 1, """
+    Write a compelling 3-4 line personalized outbound email from Niya to the prospect described below.
+
+    The email should:
+    1. Be personalized and relevant to their role/company
+    2. Mention their company stage if relevant
+    3. Offer a 15-minute discovery call
+    4. Include a Calendly link: {calendly_link}
+    5. Be professional but conversational
+    6. End with a clear call-to-action
+
+    Format: Subject line on first line, then email body.
+""", [
+    ("Name", "Lead Name", "the prospect", False),
+    ("Role", "Role", "decision maker", False),
+    ("Company", "Company Name", "their company", False),
+    ("Company context", "Company Description", "", True),
+    ("Stage", "Stage", "Series B/C", False),
+]))
+
+register(PromptTemplate("follow_up", 1, """
+    Write a follow-up email from Niya to the prospect described below, of the kind given under "Follow-up".
+
+    Include the Calendly link: {calendly_link}
+    Keep it professional and respectful.
+
+    Format: Subject line on first line, then email body.
+""", [
+    ("Follow-up", "follow_up_kind", "follow-up", False),
+    ("Name", "Lead Name", "the prospect", False),
+    ("Company", "Company Name", "their company", False),
+    ("Previous context", "Notes/Objections", "", True),
+    ("Original email sent", "Last Email Sent", "", False),
+]))
+
+register(PromptTemplate("classify_reply", 1, """
+    Analyze the email reply below and classify it into one of these categories:
+    {categories}
+
+    Return JSON format:
+    {{
+        "category": "Interested/Later/Not Now/Wrong Person/Meeting Booked",
+        "confidence": 0.95,
+        "key_points": ["point1", "point2"],
+        "next_action": "suggested next step",
+        "calendly_clicked": true/false
+    }}
+""", [
+    ("Reply", "reply", "", True),
+]).bind(categories=REPLY_CATEGORIES))
+
+register(PromptTemplate("classify_replies", 1, """
+    Analyze each of the email replies below and classify it into one of these categories:
+    {categories}
+
+    Return only a JSON array with one object per reply, in the same order:
+    [
+        {{
+            "id": "the reply's id",
+            "category": "Interested/Later/Not Now/Wrong Person/Meeting Booked",
+            "confidence": 0.95,
+            "key_points": ["point1", "point2"],
+            "next_action": "suggested next step",
+            "calendly_clicked": true/false
+        }}
+    ]
+""", [
+    ("Replies (JSON list of objects with \"id\" and \"text\")", "replies_json", "[]", False),
+]).bind(categories=REPLY_CATEGORIES))
+
+register(PromptTemplate("demo_brief", 1, """
+    Generate a 200-word demo briefing for Jayashree at Niya to pitch to the B2B lead described below.
+
+    The output should include:
+    1. Summary of what the company likely does
+    2. What the role's top concern might be
+    3. A custom angle to pitch Niya's mental fitness bootcamp
+
+    Keep it sharp and to the point.
+""", [
+    ("Lead Name", "Lead Name", "", False),
+    ("Role", "Role", "", False),
+    ("Company", "Company Name", "", False),
+    ("Industry", "Industry", "", False),
+    ("Company Size", "Company Size", "", False),
+    ("Website/LinkedIn", "Website/LinkedIn", "", False),
+    ("Notes/Objections", "Notes/Objections", "", True),
+    ("Reply Type", "Reply Type", "", False),
+]))
@@ -0,0 +1,118 @@
+"""
+Token-bucket rate limiting keyed per destination
+Callers block only as long as the destination's budget requires instead of sleeping a fixed time
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration (requests per second unless stated otherwise)
+AIRTABLE_RATE_LIMIT = float(os.getenv("AIRTABLE_RATE_LIMIT", "5"))  # Airtable allows 5 req/s per base
+EMAIL_RATE_LIMIT = float(os.getenv("EMAIL_RATE_LIMIT", "1"))
+GOOGLE_SEARCH_RATE_LIMIT = float(os.getenv("GOOGLE_SEARCH_RATE_LIMIT", "0.5"))
+SCRAPE_RATE_LIMIT = float(os.getenv("SCRAPE_RATE_LIMIT", "0.5"))
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "10000"))
+
+# Destination prefix -> (refill rate per second, bucket capacity)
+LIMITS: Dict[str, Tuple[float, float]] = {
+    "airtable": (AIRTABLE_RATE_LIMIT, AIRTABLE_RATE_LIMIT),
+    "email": (EMAIL_RATE_LIMIT, 1),
+    "google_search": (GOOGLE_SEARCH_RATE_LIMIT, 1),
+    "scrape": (SCRAPE_RATE_LIMIT, 1),
+    # OpenAI enforces per-minute windows, so allow a full minute of burst
+    "openai_requests": (OPENAI_RPM / 60, OPENAI_RPM),
+    "openai_tokens": (OPENAI_TPM / 60, OPENAI_TPM),
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() reserves tokens and sleeps off any deficit"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take tokens from the bucket and return how long the caller must wait before using them"""
+        # A single request larger than the bucket would otherwise never be admitted
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            # Reserve now and let the balance go negative so concurrent callers queue up fairly
+            self._tokens -= tokens
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Take tokens from the bucket, blocking until they are available; returns seconds waited"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: float = 1) -> float:
+        """Like acquire(), but yields to the event loop while waiting"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_limiter(key: str) -> TokenBucket:
+    """Return the bucket for a destination key such as "airtable:appXXXX" or "email:smtp.zoho.com"
+
+    The part before the first colon selects the limit in LIMITS; each full key gets its own bucket.
+    """
+    bucket = _buckets.get(key)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(key)
+            if bucket is None:
+                rate, capacity = LIMITS[key.split(":", 1)[0]]
+                bucket = _buckets[key] = TokenBucket(rate, capacity)
+    return bucket
+
+
+def acquire(key: str, tokens: float = 1) -> float:
+    """Block until the destination's budget allows another call"""
+    return get_limiter(key).acquire(tokens)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count; about four characters per token for English text"""
+    return len(text) // 4
+
+
+def acquire_openai(prompt: str, max_tokens: int) -> float:
+    """Reserve one request plus the estimated prompt and completion tokens against the RPM/TPM budgets"""
+    estimated_tokens = estimate_tokens(prompt) + max_tokens
+    return acquire("openai_requests") + acquire("openai_tokens", estimated_tokens)
+
+
+async def acquire_async(key: str, tokens: float = 1) -> float:
+    """Event-loop friendly acquire()"""
+    return await get_limiter(key).acquire_async(tokens)
+
+
+async def acquire_openai_async(prompt: str, max_tokens: int) -> float:
+    """Event-loop friendly acquire_openai()"""
+    estimated_tokens = estimate_tokens(prompt) + max_tokens
+    return await acquire_async("openai_requests") + await acquire_async("openai_tokens", estimated_tokens)
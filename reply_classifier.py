@@ -0,0 +1,214 @@
+"""
+Tiered reply classification
+Cheap local tiers (compiled rules, then an optional TF-IDF + logistic regression model) answer the
+replies they are confident about; only the rest escalate to the LLM. Per-tier hit rates and latency
+are tracked so the thresholds can be tuned.
+"""
+
+import os
+import pickle
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+try:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+except ImportError:
+    # scikit-learn is optional; without it only the rule tier runs locally
+    make_pipeline = None
+
+load_dotenv()
+
+REPLY_LOCAL_CONFIDENCE = float(os.getenv("REPLY_LOCAL_CONFIDENCE", "0.85"))  # Below this, escalate to the next tier
+REPLY_MODEL_PATH = os.getenv("REPLY_MODEL_PATH", ".niya_reply_model.pkl")
+REPLY_TEXT_FIELD = os.getenv("REPLY_TEXT_FIELD", "Last Reply")  # Lead field holding the reply text used for training
+REPLY_MIN_TRAINING_EXAMPLES = 20
+AMBIGUOUS_CONFIDENCE = 0.6  # Phrases interested replies use too; below the threshold, so they escalate
+
+# A booking confirmation, as opposed to a reply that merely mentions the booking link
+BOOKING_PATTERN = re.compile(
+    r"(\bcalendly\b.{0,80}\b(confirmed|scheduled|booked)\b|\b(booked|scheduled) (a|the) (call|meeting|slot|time)\b"
+    r"|\bnew event:|\binvitation:|\bmeeting (is )?confirmed\b)", re.I | re.S)
+
+# (category, confidence, next action, pattern); a reply matching rules of different categories is escalated
+RULES = [
+    ("Later", 0.95, "Auto-reply; follow up after they return", re.compile(
+        r"\b(out of (the )?office|auto(matic)?[- ]?reply|away from (my |the )?(desk|office)"
+        r"|on (annual |parental |maternity |paternity |sick )?leave|limited access to (my )?e-?mail)\b", re.I)),
+    ("Later", AMBIGUOUS_CONFIDENCE, "Auto-reply; follow up after they return", re.compile(
+        r"\b((will be|i'?ll be|i am|i'?m) back on|returning on)\b", re.I)),
+    # Only an unsubscribe request that opens the reply; "how do I unsubscribe my team from..." is not one
+    ("Not Now", 0.95, "Unsubscribed; do not contact again", re.compile(
+        r"(\A\W*(please\W+)?(unsubscribe|opt[- ]?out)\b|\b(remove me|take me off|stop (e-?mailing|contacting|sending) (me|us)"
+        r"|(do not|don'?t) (contact|e-?mail) me)\b)", re.I)),
+    ("Not Now", AMBIGUOUS_CONFIDENCE, "Unsubscribed; do not contact again", re.compile(
+        r"\b(unsubscribe|opt[- ]?out|stop sending)\b", re.I)),
+    ("Wrong Person", 0.9, "Find the right contact at the company", re.compile(
+        r"\b(wrong person|not the right (person|contact)|no longer (with|at|work)|(have|has) left the company"
+        # Only a redirect to someone else; "you should contact me next week" is not one
+        r"|(contact|reach out to|speak (to|with)|talk to) (my|our) (colleague|manager|boss)"
+        r"|(contact|reach out to|speak (to|with)|talk to) ((?-i:[A-Z][a-z]+)( (?-i:[A-Z][a-z]+))?|[\w.+-]+@[\w.-]+) instead"
+        r")\b", re.I)),
+    ("Wrong Person", AMBIGUOUS_CONFIDENCE, "Find the right contact at the company", re.compile(
+        r"\bnot (responsible|in charge) (for|of)\b", re.I)),
+    ("Meeting Booked", 0.9, "Prepare for the booked call", BOOKING_PATTERN),
+]
+
+
+def calendly_clicked(text: str) -> bool:
+    """Whether a reply confirms the lead booked through the link"""
+    return bool(BOOKING_PATTERN.search(text or ""))
+
+
+class RuleTier:
+    """Compiled regex rules for replies that need no judgement"""
+
+    name = "rules"
+
+    def __init__(self, rules=RULES):
+        self.rules = rules
+
+    def classify(self, text: str) -> Optional[Dict]:
+        matches = [rule for rule in self.rules if rule[3].search(text)]
+        if len({rule[0] for rule in matches}) != 1:
+            return None
+        category, confidence, next_action, pattern = max(matches, key=lambda rule: rule[1])
+        return {
+            "category": category,
+            "confidence": confidence,
+            "key_points": [f"Matched \"{pattern.search(text).group(0)}\""],
+            "next_action": next_action,
+            "calendly_clicked": calendly_clicked(text)
+        }
+
+
+class ModelTier:
+    """TF-IDF + logistic regression trained on previously classified replies"""
+
+    name = "model"
+
+    def __init__(self, model):
+        self.model = model
+
+    @classmethod
+    def train(cls, texts: List[str], labels: List[str], path: Optional[str] = REPLY_MODEL_PATH) -> "ModelTier":
+        if make_pipeline is None:
+            raise RuntimeError("scikit-learn is required to train the reply model")
+        model = make_pipeline(
+            TfidfVectorizer(ngram_range=(1, 2), min_df=1, sublinear_tf=True),
+            LogisticRegression(max_iter=1000)
+        )
+        model.fit(texts, labels)
+        if path:
+            with open(path, "wb") as f:
+                pickle.dump(model, f)
+        return cls(model)
+
+    @classmethod
+    def load(cls, path: str = REPLY_MODEL_PATH) -> Optional["ModelTier"]:
+        """The saved model, or None when there is none or scikit-learn is not installed"""
+        if make_pipeline is None or not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return cls(pickle.load(f))
+
+    def classify(self, text: str) -> Optional[Dict]:
+        probabilities = self.model.predict_proba([text])[0]
+        best = probabilities.argmax()
+        return {
+            "category": str(self.model.classes_[best]),
+            "confidence": float(probabilities[best]),
+            "key_points": ["Classified by the local reply model"],
+            "next_action": "Review and respond",
+            "calendly_clicked": calendly_clicked(text)
+        }
+
+
+def training_examples(records: Iterable[Dict], label_field: str = "Reply Type",
+                      text_field: str = REPLY_TEXT_FIELD) -> tuple:
+    """(texts, labels) from lead records that have both a reply and a label"""
+    texts, labels = [], []
+    for record in records:
+        fields = record.get("fields", {})
+        if fields.get(text_field) and fields.get(label_field):
+            texts.append(fields[text_field])
+            labels.append(fields[label_field])
+    return texts, labels
+
+
+class TieredReplyClassifier:
+    """Try each local tier in order and escalate only low-confidence replies to the LLM
+
+    llm classifies one reply and llm_many a dict of reply ID -> text; both return the same shape as
+    the local tiers. Every result carries "tier" with the name of the tier that answered.
+    """
+
+    def __init__(self, tiers: List, llm: Callable[[str], Dict], llm_many: Callable[[Dict[str, str]], Dict[str, Dict]],
+                 threshold: float = REPLY_LOCAL_CONFIDENCE):
+        self.tiers = tiers
+        self.llm = llm
+        self.llm_many = llm_many
+        self.threshold = threshold
+        self._stats = {name: {"seen": 0, "answered": 0, "seconds": 0.0}
+                       for name in [tier.name for tier in tiers] + ["llm"]}
+        self._lock = threading.Lock()
+
+    def _record(self, tier_name: str, seen: int, answered: int, seconds: float):
+        with self._lock:
+            stats = self._stats[tier_name]
+            stats["seen"] += seen
+            stats["answered"] += answered
+            stats["seconds"] += seconds
+
+    def _local(self, text: str) -> Optional[Dict]:
+        for tier in self.tiers:
+            started = time.perf_counter()
+            result = tier.classify(text)
+            accepted = result is not None and result["confidence"] >= self.threshold
+            self._record(tier.name, 1, int(accepted), time.perf_counter() - started)
+            if accepted:
+                return {**result, "tier": tier.name}
+        return None
+
+    def classify(self, text: str) -> Dict:
+        result = self._local(text)
+        if result is not None:
+            return result
+        started = time.perf_counter()
+        result = self.llm(text)
+        self._record("llm", 1, 1, time.perf_counter() - started)
+        return {**result, "tier": "llm"}
+
+    def classify_many(self, replies: Dict[str, str]) -> Dict[str, Dict]:
+        """Classify locally where possible and send the remainder to the LLM together"""
+        results, remaining = {}, {}
+        for reply_id, text in replies.items():
+            result = self._local(text)
+            if result is not None:
+                results[reply_id] = result
+            else:
+                remaining[reply_id] = text
+        if remaining:
+            started = time.perf_counter()
+            escalated = self.llm_many(remaining)
+            self._record("llm", len(remaining), len(escalated), time.perf_counter() - started)
+            results.update({reply_id: {**result, "tier": "llm"} for reply_id, result in escalated.items()})
+        return results
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per tier: replies seen, replies answered, hit rate and average latency in milliseconds"""
+        with self._lock:
+            return {
+                name: {
+                    "seen": s["seen"],
+                    "answered": s["answered"],
+                    "hit_rate": s["answered"] / s["seen"] if s["seen"] else 0.0,
+                    "avg_ms": s["seconds"] * 1000 / s["seen"] if s["seen"] else 0.0
+                }
+                for name, s in self._stats.items()
+            }
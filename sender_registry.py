@@ -0,0 +1,332 @@
+"""
+Weighted, health-aware routing over several sending accounts
+Each email goes to the next account by smooth weighted round-robin among the accounts that are under
+their daily quota and not cooling down after a failure. When an account fails to authenticate or
+connect, the email fails over to the next account instead of being dropped. When the provider may already
+have accepted it, it is never resent through another account.
+"""
+
+import json
+import os
+import smtplib
+import threading
+import time
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from google.auth.exceptions import GoogleAuthError
+from googleapiclient.errors import HttpError
+
+import email_senders
+import rate_limiter
+
+load_dotenv()
+
+EMAIL_ACCOUNTS_FILE = os.getenv("EMAIL_ACCOUNTS_FILE", "email_accounts.json")
+EMAIL_USAGE_FILE = os.getenv("EMAIL_USAGE_FILE", ".niya_email_usage.json")  # Sends per account today
+EMAIL_FAILURE_COOLDOWN = float(os.getenv("EMAIL_FAILURE_COOLDOWN", "60"))  # Doubles with each consecutive failure
+EMAIL_AUTH_COOLDOWN = float(os.getenv("EMAIL_AUTH_COOLDOWN", "3600"))  # A rejected login will not fix itself mid-run
+HEALTH_DECAY = 0.8  # Each send moves the health score 20% of the way towards 1 (sent) or 0 (failed)
+MIN_HEALTH = 0.1  # Floor on the weight multiplier so a recovered account gets traffic again
+
+# What a failed send says about the account
+AUTH = "auth"  # Credentials rejected; cool down for EMAIL_AUTH_COOLDOWN and fail over
+CONNECTION = "connection"  # Server unreachable, dropped or refusing to send; back off and fail over
+MESSAGE = "message"  # This message was rejected (e.g. bad recipient); another account would fare no better
+UNCONFIRMED = "unconfirmed"  # Timed out or failed server-side after sending; another account could send it twice
+
+
+class AllSendersFailed(RuntimeError):
+    """No account could send the email"""
+
+
+def classify_error(error: Exception) -> str:
+    if isinstance(error, email_senders.DeliveryUnknown):
+        return UNCONFIRMED
+    if isinstance(error, (smtplib.SMTPAuthenticationError, GoogleAuthError, FileNotFoundError)):
+        return AUTH
+    if isinstance(error, email_senders.MESSAGE_ERRORS):
+        return MESSAGE
+    if isinstance(error, HttpError):
+        if error.resp.status in (401, 403):
+            return AUTH
+        if error.resp.status in (400, 404):
+            return MESSAGE
+        if error.resp.status >= 500:
+            # Gmail answered only after taking the request; it may have sent the message anyway
+            return UNCONFIRMED
+    return CONNECTION
+
+
+def as_delivery_unknown(error: Exception) -> Exception:
+    """An UNCONFIRMED failure as a DeliveryUnknown, so callers only need to catch the one type"""
+    if isinstance(error, email_senders.DeliveryUnknown):
+        return error
+    unknown = email_senders.DeliveryUnknown(f"the server failed after taking the message ({error!r})")
+    unknown.__cause__ = error
+    return unknown
+
+
+class SenderAccount:
+    """One sending identity: a transport with send(message) plus its routing weight and daily quota
+
+    The transport is built on first use, so an account whose credentials are missing only fails
+    when it is picked and then fails over like any other auth error.
+    """
+
+    def __init__(self, name: str, provider: str, transport_factory: Callable[[], object], from_address: Optional[str],
+                 weight: float = 1.0, daily_quota: Optional[int] = None):
+        self.name = name
+        self.provider = provider
+        self.from_address = from_address
+        self.weight = weight
+        self.daily_quota = daily_quota
+        self.health = 1.0
+        self.failures = 0  # Consecutive
+        self.cooldown_until = 0.0
+        self.current = 0.0  # Smooth weighted round-robin counter
+        self._transport_factory = transport_factory
+        self._transport = None
+        self._transport_lock = threading.Lock()
+
+    @property
+    def transport(self):
+        if self._transport is None:
+            with self._transport_lock:
+                if self._transport is None:
+                    self._transport = self._transport_factory()
+        return self._transport
+
+    def effective_weight(self) -> float:
+        return self.weight * max(self.health, MIN_HEALTH)
+
+    def transport_stats(self) -> Dict[str, int]:
+        """The transport's own counters (SMTP sessions opened, reconnects), if it has been built and keeps any"""
+        if self._transport is None or not hasattr(self._transport, "stats"):
+            return {}
+        return self._transport.stats()
+
+    def close(self):
+        if self._transport is not None and hasattr(self._transport, "close"):
+            self._transport.close()
+
+
+def build_account(config: Dict) -> SenderAccount:
+    """Account from one entry of the accounts file
+
+    Gmail entries take service_account_file and sender; SMTP entries (Zoho on 465 or 587, or any
+    other server) take host, port, username, password or password_env, from and security.
+    """
+    provider = config.get("provider", "smtp")
+    weight = float(config.get("weight", 1))
+    daily_quota = config.get("daily_quota")
+    if provider == "gmail":
+        sender = config.get("sender", email_senders.GMAIL_SENDER)
+        path = config.get("service_account_file", email_senders.GMAIL_SERVICE_ACCOUNT_FILE)
+        return SenderAccount(config.get("name", "gmail"), provider,
+                             lambda: email_senders.GmailSender.from_service_account(path, sender),
+                             sender, weight, daily_quota)
+
+    host, port = config["host"], int(config.get("port", 465))
+    username = config.get("username")
+    password = config.get("password") or os.getenv(config.get("password_env", ""), "")
+    security = config.get("security")
+    return SenderAccount(config.get("name", f"{host}:{port}"), provider,
+                         lambda: email_senders.SMTPPool(host, port, username, password, security=security),
+                         config.get("from", username), weight, daily_quota)
+
+
+def accounts_from_env() -> List[Dict]:
+    """The single account configured by EMAIL_PROVIDER and SMTP_*, used when there is no accounts file"""
+    if os.getenv("EMAIL_PROVIDER", "gmail").lower() == "gmail":
+        return [{"name": "gmail", "provider": "gmail"}]
+    server = os.getenv("SMTP_SERVER")
+    return [{
+        "name": server or "smtp",
+        "provider": "smtp",
+        "host": server,
+        "port": int(os.getenv("SMTP_PORT", "465")),
+        "username": os.getenv("SMTP_USERNAME"),
+        "password_env": "SMTP_PASSWORD"
+    }]
+
+
+class SenderRegistry:
+    """Routes each email to an account and keeps per-account quota use and health"""
+
+    def __init__(self, accounts: List[SenderAccount], usage_path: Optional[str] = EMAIL_USAGE_FILE):
+        self.accounts = accounts
+        self.usage_path = usage_path
+        self._lock = threading.Lock()
+        self._usage_day = date.today().isoformat()
+        self._sent_today: Dict[str, int] = {}
+        self._load_usage()
+
+    @classmethod
+    def from_config(cls, path: str = EMAIL_ACCOUNTS_FILE) -> "SenderRegistry":
+        """Accounts from the JSON accounts file if there is one, else the single account from the environment"""
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                configs = json.load(f)
+        else:
+            configs = accounts_from_env()
+        return cls([build_account(config) for config in configs])
+
+    def _load_usage(self):
+        if not self.usage_path or not os.path.exists(self.usage_path):
+            return
+        try:
+            with open(self.usage_path, "r", encoding="utf-8") as f:
+                usage = json.load(f)
+            if usage.get("date") == self._usage_day:
+                self._sent_today = usage["sent"]
+        except (ValueError, KeyError) as e:
+            print(f"⚠️ Ignoring unreadable email usage {self.usage_path}: {e}")
+
+    def _save_usage(self):
+        if not self.usage_path:
+            return
+        tmp_path = f"{self.usage_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"date": self._usage_day, "sent": self._sent_today}, f, separators=(",", ":"))
+        os.replace(tmp_path, self.usage_path)
+
+    def _roll_day(self):
+        today = date.today().isoformat()
+        if today != self._usage_day:
+            self._usage_day = today
+            self._sent_today = {}
+
+    def remaining(self, account: SenderAccount) -> Optional[int]:
+        """Sends left in the account's daily quota, or None when it has no quota"""
+        with self._lock:
+            self._roll_day()
+            if account.daily_quota is None:
+                return None
+            return max(0, account.daily_quota - self._sent_today.get(account.name, 0))
+
+    def _available(self, account: SenderAccount, now: float, count: int = 1) -> bool:
+        if account.cooldown_until > now:
+            return False
+        quota_left = self.remaining(account)
+        return quota_left is None or quota_left >= count
+
+    def _pick(self, exclude: set) -> Optional[SenderAccount]:
+        """Smooth weighted round-robin over the available accounts, weights scaled by health"""
+        now = time.monotonic()
+        candidates = [account for account in self.accounts
+                      if account.name not in exclude and self._available(account, now)]
+        if not candidates:
+            return None
+        with self._lock:
+            total = 0.0
+            for account in candidates:
+                account.current += account.effective_weight()
+                total += account.effective_weight()
+            chosen = max(candidates, key=lambda account: account.current)
+            chosen.current -= total
+        return chosen
+
+    def record_success(self, account: SenderAccount, count: int = 1):
+        with self._lock:
+            self._roll_day()
+            self._sent_today[account.name] = self._sent_today.get(account.name, 0) + count
+            account.health = account.health * HEALTH_DECAY + (1 - HEALTH_DECAY)
+            account.failures = 0
+            self._save_usage()
+
+    def record_failure(self, account: SenderAccount, error: Exception) -> str:
+        """Update the account's health and cooldown; returns the failure kind"""
+        kind = classify_error(error)
+        if kind == MESSAGE:
+            return kind
+        with self._lock:
+            account.health *= HEALTH_DECAY
+            account.failures += 1
+            cooldown = EMAIL_AUTH_COOLDOWN if kind == AUTH else min(
+                EMAIL_FAILURE_COOLDOWN * 2 ** (account.failures - 1), EMAIL_AUTH_COOLDOWN)
+            account.cooldown_until = time.monotonic() + cooldown
+        print(f"⚠️ {account.name}: {kind} failure ({error!r}); resting it for {cooldown:.0f}s")
+        return kind
+
+    def send(self, to: str, subject: str, body: str) -> str:
+        """Send through the next available account, failing over on auth and connection errors
+
+        Returns the name of the account that sent it. A rejected message is raised as is, and a send
+        the provider may have accepted as DeliveryUnknown; neither is tried on another account. When
+        every account fails or none is available, AllSendersFailed is raised.
+        """
+        tried = set()
+        last_error = None
+        while True:
+            account = self._pick(tried)
+            if account is None:
+                raise AllSendersFailed(f"No sending account available (last error: {last_error!r})")
+            tried.add(account.name)
+            rate_limiter.acquire(f"email:{account.name}")
+            try:
+                account.transport.send(email_senders.build_message(account.from_address, to, subject, body))
+            except Exception as e:
+                kind = self.record_failure(account, e)
+                if kind == MESSAGE:
+                    raise
+                if kind == UNCONFIRMED:
+                    raise as_delivery_unknown(e)
+                last_error = e
+                continue
+            self.record_success(account)
+            return account.name
+
+    def batch_account(self, count: int) -> Optional[SenderAccount]:
+        """The healthiest available Gmail account with quota left for count messages, if any"""
+        now = time.monotonic()
+        candidates = [account for account in self.accounts
+                      if account.provider == "gmail" and self._available(account, now, count)]
+        return max(candidates, key=lambda account: account.effective_weight(), default=None)
+
+    def send_batch(self, account: SenderAccount,
+                   emails: Dict[str, Tuple[str, str, str]]) -> Dict[str, Optional[Exception]]:
+        """Send (to, subject, body) emails keyed by lead record ID in Gmail API batches from one account
+
+        Returns each key mapped to None or the exception it failed with; classify_error tells which
+        failures are worth retrying through send(). MESSAGE and UNCONFIRMED failures are not.
+        """
+        for _ in emails:
+            rate_limiter.acquire(f"email:{account.name}")
+        try:
+            transport = account.transport
+        except Exception as e:
+            self.record_failure(account, e)
+            return {key: e for key in emails}
+        errors = transport.send_batch({
+            key: email_senders.build_message(account.from_address, to, subject, body)
+            for key, (to, subject, body) in emails.items()
+        })
+        sent = sum(1 for key in emails if errors.get(key) is None)
+        if sent:
+            self.record_success(account, sent)
+        account_errors = [error for error in errors.values() if error is not None and classify_error(error) != MESSAGE]
+        if account_errors:
+            self.record_failure(account, account_errors[0])
+        return errors
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per account: sends today, daily quota, health score, whether it is resting and transport counters"""
+        now = time.monotonic()
+        with self._lock:
+            self._roll_day()
+            return {
+                account.name: {
+                    "sent_today": self._sent_today.get(account.name, 0),
+                    "daily_quota": account.daily_quota,
+                    "health": round(account.health, 2),
+                    "resting": account.cooldown_until > now,
+                    "transport": account.transport_stats()
+                }
+                for account in self.accounts
+            }
+
+    def close(self):
+        for account in self.accounts:
+            account.close()
@@ -0,0 +1,140 @@
+"""
+Write-behind buffer for Airtable record updates
+Updates are collected off the critical path, merged per record and written by a background thread in
+batched PATCHes of up to 10 records, on a timer or when enough records are waiting. A batch Airtable
+rejects outright is split until the record at fault is found, so it cannot hold back the others.
+"""
+
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+import airtable_client
+
+load_dotenv()
+
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "2"))  # Seconds between timed flushes
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "3"))  # Flushes a failed update is retried in
+
+
+def _rejected(error: Exception) -> bool:
+    """Airtable refused the request itself (a 4xx other than 429), so sending it again unchanged won't help"""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+class WriteBehindBuffer:
+    """Coalescing buffer in front of a batch update such as AirtableAPI.batch_update
+
+    write receives a list of {"id": ..., "fields": {...}} with at most batch_size entries. Several
+    updates to one record before a flush are merged, later fields winning, and go out as one entry.
+    Each add() may pass on_written, called once that record's fields have been saved.
+    """
+
+    def __init__(self, write: Callable[[List[Dict]], object], interval: float = WRITE_BEHIND_INTERVAL,
+                 batch_size: int = airtable_client.BATCH_SIZE, max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS):
+        self.write = write
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._pending: Dict[str, Dict] = {}  # Insertion order is the order records are flushed in
+        self._callbacks: Dict[str, List[Callable[[], None]]] = {}
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"updates": 0, "records": 0, "requests": 0, "failed": 0}
+
+    def add(self, record_id: str, fields: Dict, on_written: Optional[Callable[[], None]] = None):
+        with self._lock:
+            self._pending[record_id] = {**self._pending.get(record_id, {}), **fields}
+            if on_written is not None:
+                self._callbacks.setdefault(record_id, []).append(on_written)
+            self._stats["updates"] += 1
+            full = len(self._pending) >= self.batch_size
+            if self._thread is None and not self._closed.is_set():
+                # Started on first use so commands that never write don't leave a thread behind
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write everything pending now, batch_size records per request"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                callbacks, self._callbacks = self._callbacks, {}
+            record_ids = list(pending)
+            for start in range(0, len(record_ids), self.batch_size):
+                self._write_chunk(record_ids[start:start + self.batch_size], pending, callbacks)
+
+    def _write_chunk(self, chunk: List[str], pending: Dict[str, Dict], callbacks: Dict[str, List]):
+        try:
+            self.write([{"id": record_id, "fields": pending[record_id]} for record_id in chunk])
+        except Exception as e:
+            if not _rejected(e):
+                self._requeue(chunk, pending, callbacks, e)
+            elif len(chunk) > 1:
+                # One bad record, such as a lead deleted in Airtable, fails the whole request; halve to find it
+                middle = len(chunk) // 2
+                self._write_chunk(chunk[:middle], pending, callbacks)
+                self._write_chunk(chunk[middle:], pending, callbacks)
+            else:
+                with self._lock:
+                    self._give_up(chunk[0], 1, e)
+            return
+        with self._lock:
+            self._stats["records"] += len(chunk)
+            self._stats["requests"] += 1
+        for record_id in chunk:
+            self._attempts.pop(record_id, None)
+            for callback in callbacks.get(record_id, []):
+                callback()
+
+    def _give_up(self, record_id: str, attempts: int, error: Exception):
+        """Drop a record's update; called with _lock held"""
+        self._attempts.pop(record_id, None)
+        self._stats["failed"] += 1
+        print(f"❌ Giving up on update to {record_id} after {attempts} attempts: {error}")
+
+    def _requeue(self, chunk: List[str], pending: Dict[str, Dict], callbacks: Dict[str, List], error: Exception):
+        """Put a failed chunk back under any newer updates, dropping records that keep failing"""
+        with self._lock:
+            for record_id in chunk:
+                attempts = self._attempts.get(record_id, 0) + 1
+                if attempts >= self.max_attempts:
+                    self._give_up(record_id, attempts, error)
+                    continue
+                self._attempts[record_id] = attempts
+                self._pending[record_id] = {**pending[record_id], **self._pending.get(record_id, {})}
+                self._callbacks[record_id] = callbacks.get(record_id, []) + self._callbacks.get(record_id, [])
+        print(f"⚠️ Batched update of {len(chunk)} records failed, will retry: {error}")
+
+    def close(self):
+        """Stop the background thread and write whatever is still pending"""
+        self._closed.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        # Final flushes retry failed chunks immediately until they succeed or are given up on
+        for _ in range(self.max_attempts):
+            self.flush()
+            with self._lock:
+                if not self._pending:
+                    break
+
+    def stats(self) -> Dict[str, int]:
+        """Updates buffered, records written, PATCH requests sent and records given up on"""
+        with self._lock:
+            return dict(self._stats)